@@ -0,0 +1,105 @@
+"""
+Micro-benchmark: raw ndarray input vs JPEG round trip for EasyOCR
+
+Usage:
+    python benchmark_ocr_input.py [plate_crop.jpg] [--repeat 50] [--ocr]
+
+Without --ocr only the input preparation is timed (JPEG encode in our code
+plus the decode EasyOCR does on bytes; BGR -> RGB in raw mode). With --ocr the full read_text call
+is timed in both modes (needs EasyOCR weights).
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from config import OCRConfig
+from preprocess_image import ImagePreprocessor
+from utils import prepare_ocr_input
+from yolo_detector import OptimizedPreprocessing
+
+
+def make_synthetic_plate():
+    """Draw a one-line plate crop when no image is given"""
+    plate = np.full((110, 470, 3), 235, dtype=np.uint8)
+    cv2.rectangle(plate, (4, 4), (465, 105), (20, 20, 20), 3)
+    cv2.putText(plate, "51F-123.45", (20, 80), cv2.FONT_HERSHEY_SIMPLEX,
+                2.2, (15, 15, 15), 6)
+    noise = np.random.default_rng(0).normal(0, 8, plate.shape)
+    return np.clip(plate + noise, 0, 255).astype(np.uint8)
+
+
+def build_variants(plate):
+    """Variant set similar to the OCR pipelines"""
+    preprocessor = ImagePreprocessor()
+    variants = [(img, name) for img, name in OptimizedPreprocessing.create_variants(plate)]
+    variants.append((preprocessor.enhance_plate(plate), "enhance_plate"))
+    return variants
+
+
+def decode_like_easyocr(image_input):
+    """What EasyOCR does with its input before detection"""
+    if isinstance(image_input, bytes):
+        img = cv2.imdecode(np.frombuffer(image_input, np.uint8), cv2.IMREAD_COLOR)
+        return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    if image_input.ndim == 2:
+        return cv2.cvtColor(image_input, cv2.COLOR_GRAY2BGR)
+    return image_input
+
+
+def time_call(func, repeat):
+    """Mean time of func() in milliseconds"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) * 1000.0 / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("image", nargs="?", help="Plate crop (default: synthetic)")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--ocr", action="store_true", help="Also time full read_text")
+    args = parser.parse_args()
+
+    plate = cv2.imread(args.image) if args.image else make_synthetic_plate()
+    if plate is None:
+        raise SystemExit(f"Cannot read image: {args.image}")
+
+    variants = build_variants(plate)
+
+    print(f"{'variant':<16}{'shape':>14}{'jpeg ms':>10}{'raw ms':>9}{'saved':>8}{'jpeg MAE':>10}")
+    total_jpeg = total_raw = 0.0
+    for img, name in variants:
+        jpeg_ms = time_call(lambda: decode_like_easyocr(prepare_ocr_input(img, raw=False)), args.repeat)
+        raw_ms = time_call(lambda: decode_like_easyocr(prepare_ocr_input(img, raw=True)), args.repeat)
+        total_jpeg += jpeg_ms
+        total_raw += raw_ms
+
+        # Difference between the two inputs EasyOCR sees, channel by channel:
+        # JPEG loss only, as both paths hand CRAFT the same (RGB) order
+        raw = decode_like_easyocr(prepare_ocr_input(img, raw=True))
+        decoded = decode_like_easyocr(prepare_ocr_input(img, raw=False))
+        mae = float(np.mean(cv2.absdiff(raw, decoded)))
+
+        print(f"{name:<16}{str(img.shape):>14}{jpeg_ms:>10.3f}{raw_ms:>9.3f}"
+              f"{jpeg_ms - raw_ms:>8.3f}{mae:>10.2f}")
+
+    print(f"{'TOTAL':<30}{total_jpeg:>10.3f}{total_raw:>9.3f}{total_jpeg - total_raw:>8.3f}")
+    print(f"Per plate (variants + inverses): {2 * (total_jpeg - total_raw):.3f} ms saved")
+
+    if args.ocr:
+        from model_registry import get_ocr_detector
+
+        detector = get_ocr_detector()
+        default_mode = OCRConfig.RAW_ARRAY_INPUT
+        for raw in (False, True):
+            OCRConfig.RAW_ARRAY_INPUT = raw
+            ocr_ms = sum(time_call(lambda: detector.read_text(img), 3) for img, _ in variants)
+            print(f"read_text over variant set ({'raw' if raw else 'jpeg'}): {ocr_ms:.1f} ms")
+        OCRConfig.RAW_ARRAY_INPUT = default_mode
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Parity and latency of the OCR quantization modes (fp32 / dynamic / static INT8)
+
+Usage:
+    python benchmark_ocr_quantization.py [images/val dir] [--limit 200]
+        [--modes off dynamic static] [--truth plates.csv]
+        [--calibration-dir images/train]
+
+Plate crops are cut from the YOLO dataset labels (ocr_quantization.load_plate_crops).
+Static mode is calibrated on another split (default
+OCRConfig.QUANTIZATION_CALIBRATION_DIR); if it is the benchmarked split,
+the calibration crops are left out of the scored set.
+Each mode reads every crop with detect_plate. Reported per mode:
+- read: crops read as a valid plate; every crop is a labelled plate, so
+  this is the recall against the YOLO labels
+- correct: exact plate text, when --truth gives it (CSV: crop name, text;
+  crop names are <image stem>_<label line>)
+- same text / conf diff: parity with the fp32 ('off') reads
+- mean time per crop and speedup over fp32
+"""
+import argparse
+import csv
+import time
+from pathlib import Path
+
+from config import OCRConfig
+from license_plate_detector import LicensePlateDetector
+from ocr_quantization import QUANTIZATION_MODES, load_plate_crops
+from utils import validate_vietnamese_plate, format_vietnamese_plate, clean_text
+
+
+def read_crops(detector, crops):
+    """Plate text, confidence and time (ms) of every crop"""
+    reads = []
+    for _, crop in crops:
+        start = time.perf_counter()
+        plate, conf, _ = detector.detect_plate([crop])
+        reads.append((plate, conf, (time.perf_counter() - start) * 1000.0))
+    return reads
+
+
+def load_truth(path):
+    """Crop name -> formatted plate text from a CSV (name, text)"""
+    truth = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for row in csv.reader(f):
+            if len(row) >= 2 and row[1].strip():
+                truth[row[0].strip()] = format_vietnamese_plate(clean_text(row[1]))
+    return truth
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("images_dir", nargs="?",
+                        default=str(Path(OCRConfig.QUANTIZATION_CALIBRATION_DIR).parent / 'val'),
+                        help="images/<split> directory of the YOLO dataset")
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--modes", nargs="+", default=list(QUANTIZATION_MODES),
+                        choices=QUANTIZATION_MODES)
+    parser.add_argument("--truth", help="CSV of crop name, plate text")
+    parser.add_argument("--calibration-dir", default=OCRConfig.QUANTIZATION_CALIBRATION_DIR,
+                        help="images/<split> directory static mode is calibrated on")
+    args = parser.parse_args()
+
+    # Calibration takes the first crops of its split (sorted): never score them
+    OCRConfig.QUANTIZATION_CALIBRATION_DIR = args.calibration_dir
+    held_out = 0
+    if Path(args.calibration_dir).resolve() == Path(args.images_dir).resolve():
+        held_out = OCRConfig.QUANTIZATION_CALIBRATION_CROPS
+    crops = load_plate_crops(args.images_dir, limit=args.limit + held_out)[held_out:]
+    if not crops:
+        raise SystemExit(f"No labelled plate crops in {args.images_dir}")
+
+    modes = ['off'] + [mode for mode in args.modes if mode != 'off']
+    results = {}
+    for mode in modes:
+        detector = LicensePlateDetector(quantization=mode)
+        read_crops(detector, crops[:3])  # warm-up
+        results[mode] = (detector.quantization, read_crops(detector, crops))
+
+    truth = load_truth(args.truth) if args.truth else {}
+    names = [name for name, _ in crops]
+    labelled = [i for i, name in enumerate(names) if name in truth]
+
+    reference = results['off'][1]
+    ref_ms = sum(ms for _, _, ms in reference) / len(reference)
+    print(f"\n{len(crops)} labelled plate crops from {args.images_dir}"
+          f" ({len(labelled)} with text ground truth)")
+    calibration = (f"first {held_out} crops of this split, not scored" if held_out
+                   else args.calibration_dir)
+    print(f"static mode calibrated on: {calibration}")
+    print(f"{'mode':<10}{'active':>9}{'ms/crop':>10}{'speedup':>9}{'read':>8}"
+          f"{'correct':>9}{'same text':>11}{'conf diff':>11}")
+    for mode in modes:
+        active, reads = results[mode]
+        mean_ms = sum(ms for _, _, ms in reads) / len(reads)
+        # Failed reads return a sentinel string, not None: check validity
+        read = sum(1 for plate, _, _ in reads if validate_vietnamese_plate(plate)) / len(reads)
+        correct = (f"{sum(1 for i in labelled if reads[i][0] == truth[names[i]]) / len(labelled):.1%}"
+                   if labelled else "-")
+        same = sum(1 for (plate, _, _), (ref, _, _) in zip(reads, reference) if plate == ref)
+        conf_diff = sum(abs(conf - ref_conf) for (_, conf, _), (_, ref_conf, _) in zip(reads, reference)) / len(reads)
+        print(f"{mode:<10}{active:>9}{mean_ms:>10.1f}{ref_ms / mean_ms:>8.2f}x{read:>8.1%}"
+              f"{correct:>9}{same / len(reads):>10.1%}{conf_diff:>11.3f}")
+
+if __name__ == "__main__":
+    main()
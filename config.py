@@ -6,12 +6,42 @@ Centralized settings for easy tuning
 class DetectionConfig:
     """YOLO Detection settings"""
     YOLO_MODEL_PATH = "d:/game/runs/license_plate/weights/best.pt"
+    YOLO_DEVICE = 'cpu'         # 'cpu', '0', 'cuda:0'...
     YOLO_CONF_THRESHOLD = 0.05  # Giảm từ 0.10 để phát hiện nhiều hơn
     YOLO_PADDING = 0.2
     YOLO_MIN_WIDTH = 50
     YOLO_MIN_HEIGHT = 20
     YOLO_ASPECT_RATIO_MIN = 1.5
     YOLO_ASPECT_RATIO_MAX = 7.0
+    YOLO_BATCH_SIZE = 8         # Images per forward pass (detect_plates_batch)
+    YOLO_IMGSZ = 416            # Inference / export size (= training imgsz)
+    YOLO_ADAPTIVE_IMGSZ = False  # Try YOLO_IMGSZ_STEPS smallest first
+    YOLO_IMGSZ_STEPS = (320, 416, 640)  # Escalate while no plate >= YOLO_ADAPTIVE_ACCEPT_CONF
+    YOLO_ADAPTIVE_ACCEPT_CONF = 0.5
+    YOLO_BACKEND = 'auto'       # 'auto', 'ultralytics', 'onnxruntime', 'openvino', 'opencv'
+    YOLO_EXPORT_FORMATS = ('onnx', 'openvino')  # train_yolo.export_model
+    YOLO_PARITY_TOLERANCE = 2.0  # Max box corner difference (px) exported vs .pt
+    
+    # Color-mask ROI prefilter for YOLO (detect_plates_in_roi). Off: the mask
+    # covers white / silver plates only, yellow and blue ones lie outside it
+    YOLO_COLOR_ROI_PREFILTER = False
+    YOLO_ROI_ACCEPT_CONF = 0.6  # In-ROI result kept only at this confidence, else whole frame
+    
+    # Every plate per image (detect_all_plates)
+    MULTI_PLATE_MAX = 6         # Most confident detections read
+    MULTI_PLATE_WORKERS = 2     # Plates OCR'd concurrently (<= 1: sequential)
+    MULTI_PLATE_OCR_BUDGET = 24  # OCR calls per image, shared by its plates
+    
+    # Tiled inference for large frames (detect_plates_tiled)
+    YOLO_TILED = False
+    YOLO_TILE_MIN_FRAME = 1920  # Tile frames whose longer side reaches this
+    YOLO_TILE_SIZE = 960        # Tile side in frame pixels
+    YOLO_TILE_OVERLAP = 0.2     # Fraction shared by neighbouring tiles
+    YOLO_TILE_FULL_FRAME = True  # Also run the whole frame (plates cut by every tile)
+    YOLO_TILE_MIN_TEXTURE = 4.0  # Mean |Laplacian| below which a tile is skipped
+    YOLO_TILE_MIN_MOTION = 0.005  # Changed-pixel fraction vs the previous frame below which a tile is skipped
+    YOLO_TILE_EDGE_MARGIN = 4   # Boxes this close to an inner tile edge are cut by it
+    YOLO_TILE_NMS_IOU = 0.5     # Cross-tile merge (class-agnostic)
 
 
 class OCRConfig:
@@ -30,6 +60,29 @@ class OCRConfig:
     CANVAS_SIZE = 5000         # Tăng từ 4000
     MAG_RATIO = 3.0            # Tăng từ 2.5
     
+    # Canvas used when crops are scale-normalized (no magnification needed)
+    NORMALIZED_CANVAS_SIZE = 1280
+    NORMALIZED_MAG_RATIO = 1.0
+    
+    # Input: pass uint8 arrays straight to EasyOCR (False = old JPEG bytes path)
+    RAW_ARRAY_INPUT = True
+    
+    # Batched OCR (read_text_batch)
+    RECOGNITION_BATCH_SIZE = 32
+    EARLY_STOP_BATCH_VARIANTS = 4   # Variants per batch between early-stop checks
+    
+    # Recognition-only mode for YOLO crops (skip CRAFT text detection)
+    RECOGNITION_ONLY_FOR_YOLO = True
+    RECOGNITION_ONLY_PADDING = 0.05  # Tighter crop than YOLO_PADDING
+    
+    # INT8 quantization on CPU (ocr_quantization.py; ignored with USE_GPU)
+    # 'off' = fp32, 'dynamic' = Linear/LSTM (EasyOCR default),
+    # 'static' = dynamic + convolutional backbones calibrated on plate crops
+    QUANTIZATION = 'dynamic'
+    QUANTIZATION_ENGINE = None      # None = fbgemm (x86) / qnnpack (ARM)
+    QUANTIZATION_CALIBRATION_DIR = "d:/game/archive/images/train"  # Not the split benchmarked
+    QUANTIZATION_CALIBRATION_CROPS = 64
+    
     # Other
     SLOPE_THS = 0.1            # Giảm từ 0.2
     YCENTER_THS = 0.5          # Giảm từ 0.6
@@ -58,6 +111,67 @@ class PreprocessingConfig:
     RESIZE_WIDTHS = [300, 400, 500, 600, 800]  # Thêm 800
     MIN_RESIZE_WIDTH = 400  # Tăng từ 300
     
+    # Scale normalization: resize each crop once so characters reach the
+    # height the recognizer works best at (EasyOCR recognizer input = 64px)
+    SCALE_NORMALIZATION = True
+    TARGET_CHAR_HEIGHT = 40
+    FALLBACK_CHAR_HEIGHT_RATIO = 0.6  # char height / crop height if not measurable
+    MIN_SCALE = 0.25
+    MAX_SCALE = 4.0
+    
+    # Polarity: OCR the inverted variant only when polarity is ambiguous
+    POLARITY_DETECTION = True
+    POLARITY_MAJORITY_RATIO = 0.6   # Background share to call polarity
+    POLARITY_MIN_RANGE = 20         # Below this (p98 - p2) => ambiguous
+    
+    # Deskew the plate crop after localization (projection profile);
+    # False = legacy Hough-line deskew of the whole frame
+    DESKEW_PLATE = True
+    DESKEW_MAX_ANGLE = 15         # Degrees searched each way
+    DESKEW_MIN_ANGLE = 1.0        # Rotate only above this
+    DESKEW_ANALYSIS_WIDTH = 160   # Angle search on a copy this wide
+    
+    # Coarse-to-fine plate localization (OpenCV path): candidates on a small
+    # level, refined around the candidate only, cropped from the original
+    LOCALIZE_PYRAMID = True
+    LOCALIZE_COARSE_WIDTH = 400
+    LOCALIZE_MAX_CONTOURS = 30
+    LOCALIZE_REFINE_MARGIN = 0.25     # ROI margin around the candidate (x box)
+    LOCALIZE_REFINE_MAX_WIDTH = 800   # Refinement ROI is at most this wide
+    
+    # Color-mask ROI prefilter (find_plate_by_color on a small copy): contour
+    # search only inside plate-colored, plate-shaped regions (YOLO:
+    # DetectionConfig.YOLO_COLOR_ROI_PREFILTER)
+    COLOR_ROI_PREFILTER = True
+    COLOR_ROI_WIDTH = 320             # Mask computed on a copy this wide
+    COLOR_ROI_MIN_AREA = 0.0005       # Min component area (share of frame)
+    COLOR_ROI_MARGIN = 0.25           # ROI margin around a component (x box)
+    COLOR_ROI_MAX = 4                 # Largest components kept
+    COLOR_ROI_MAX_COVERAGE = 0.25     # ROIs covering more => whole frame
+    
+    # Top-K plate candidates ranked by text-likeness (utils.text_likeness),
+    # OCR'd in that order until one is accepted
+    CANDIDATE_TOP_K = 3
+    CANDIDATE_SCORE_WIDTH = 160       # Scoring on a copy this wide
+    CANDIDATE_MAX_OVERLAP = 0.5       # IoU above which candidates are the same
+    CANDIDATE_ACCEPT_CONFIDENCE = 0.8 # Valid plate at this confidence => stop
+    
+    # Perspective rectification of the plate quadrilateral (contour quad /
+    # refined corners in YOLO boxes) to a canonical size per plate type
+    RECTIFY_PLATES = True
+    RECTIFY_SIZES = {'BSD': (520, 110), 'BSV': (330, 165)}  # (w, h), plate mm
+    RECTIFY_BSD_MIN_ASPECT = 3.0      # Quad aspect >= this => one-line plate
+    RECTIFY_MARGIN = 0.03             # Margin around the outline (per side)
+    RECTIFY_MIN_AREA_FRACTION = 0.35  # Refined outline must cover this share
+    RECTIFY_MIN_CORNER_OFFSET = 2.0   # Quads closer to their bounding box (px) are only cropped
+    RECTIFIED_MAX_VARIANTS = 6        # Variant budget for a rectified plate
+    
+    # OpenCV-path variant order (most useful first, for early stopping)
+    OPENCV_VARIANT_PRIORITY = [
+        'enhanced', 'enhanced_sharp', 'stretched', 'gamma', 'adaptive',
+        'clahe_otsu', 'edges', 'binary_127', 'gradient', 'large_2x', 'large_400'
+    ]
+    
     # Gamma
     GAMMA_BRIGHT = 1.5
     GAMMA_DARK = 0.7
@@ -66,6 +180,45 @@ class PreprocessingConfig:
     DENOISE_H = 10
     DENOISE_TEMPLATE_SIZE = 7
     DENOISE_SEARCH_SIZE = 21
+    
+    # Memo of enhance_plate results by image content (per preprocessor);
+    # small on purpose: every entry is a full variant image kept alive
+    ENHANCE_CACHE_SIZE = 4
+    
+    # Threads generating variants of one plate (<= 1: sequential)
+    VARIANT_WORKERS = 4
+    # Variants computed ahead of OCR (bounds images alive per plate)
+    VARIANT_PREFETCH = 4
+    # False: only variants the OCR loop asked for are computed (nothing is
+    # computed after an early stop). True: keep VARIANT_PREFETCH variants
+    # ahead (generation overlaps OCR, but may compute variants for nothing)
+    VARIANT_SPECULATIVE_PREFETCH = False
+    # YOLO path: variants requested ahead of the one being OCR'd (generation
+    # overlaps OCR; at most this many are computed for nothing on early stop)
+    VARIANT_LOOKAHEAD = 2
+    
+    # Dedup: skip OCR of variants whose fingerprint matches an earlier one
+    DEDUP_VARIANTS = True
+    DEDUP_GRID_SIZE = (64, 24)     # Fingerprint grid (w, h)
+    DEDUP_MAX_DISTANCE = 0.06      # Max fraction of differing cells
+    DEDUP_VOTE_WEIGHT = 0.5        # Vote weight of a skipped duplicate
+    
+    # Stage gating from one analysis pass per crop (utils.analyze_plate)
+    GATE_STAGES = True
+    ANALYSIS_MAX_WIDTH = 320          # Histogram stats on a copy this wide
+    GATE_GLARE_MIN_FRACTION = 0.002   # reduce_glare only above this share > 200
+    GATE_DENOISE_MIN_SIGMA = 2.5      # Denoise only above this noise sigma
+    
+    # Adaptive variant order (variant_stats.py): UCB win rate per OCR ms,
+    # learned per pipeline and quality bucket, persisted between runs
+    ADAPTIVE_VARIANT_ORDER = True
+    VARIANT_STATS_PATH = "variant_stats.json"  # None = in memory only
+    VARIANT_STATS_SAVE_EVERY = 10    # Plates between writes
+    VARIANT_STATS_MIN_PLATES = 30    # Hand-tuned order until then
+    VARIANT_EXPLORE_RATE = 0.05      # Share of plates using the hand-tuned order
+    VARIANT_PRUNE_MIN_RUNS = 80      # Runs before a variant can be dropped
+    VARIANT_PRUNE_WIN_RATE = 0.05    # Drop if the win rate is confidently below
+    VARIANT_MIN_KEEP = 4             # Never run fewer variants than this
 
 
 class ValidationConfig:
@@ -126,6 +279,7 @@ class ConfidenceConfig:
     # Early stopping
     EARLY_STOP_CONFIDENCE = 0.95
     EARLY_STOP_MIN_VOTES = 5
+    EARLY_STOP_ERROR_RATE = 0.05  # Accepted chance the leader would still be overtaken
 
 
 class UIConfig:
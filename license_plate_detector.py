@@ -3,40 +3,135 @@ Module nhận diện biển số xe sử dụng EasyOCR
 Optimized version with config and utils
 """
 import easyocr
+import easyocr.easyocr
 import cv2
 import re
+import time
 import numpy as np
-from collections import Counter
+from itertools import islice
+from easyocr.utils import reformat_input, get_image_list
+from easyocr.recognition import get_text
+from vote_aggregator import VoteAggregator
+from preprocess_graph import VariantDeduplicator
+from variant_stats import record_outcomes
+from ocr_quantization import (
+    QUANTIZATION_MODES, load_plate_crops, quantize_reader_static, ensure_dynamic_quantization
+)
 
 # Import config and utils
-from config import OCRConfig, ValidationConfig, ConfidenceConfig
+from config import OCRConfig, ValidationConfig, ConfidenceConfig, PreprocessingConfig
 from utils import (
     validate_vietnamese_plate, format_vietnamese_plate,
-    clean_text, has_valid_components, clamp
+    clean_text, has_valid_components, clamp, prepare_ocr_input,
+    find_text_line_split, estimate_text_polarity
 )
 
 
 class LicensePlateDetector:
     """Lớp nhận diện biển số xe - Optimized"""
     
-    def __init__(self, languages=None, gpu=None):
+    def __init__(self, languages=None, gpu=None, quantization=None):
         """
         Khởi tạo detector
         
         Args:
             languages: Danh sách ngôn ngữ (default from config)
             gpu: Sử dụng GPU hay không (default from config)
+            quantization: 'off', 'dynamic' hoặc 'static' (default from config,
+                chỉ áp dụng trên CPU)
         """
         if languages is None:
             languages = OCRConfig.LANGUAGES
         if gpu is None:
             gpu = OCRConfig.USE_GPU
+        if quantization is None:
+            quantization = OCRConfig.QUANTIZATION
+        if quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"Unknown OCR quantization: {quantization} "
+                             f"(expected one of {QUANTIZATION_MODES})")
+        if gpu:
+            quantization = 'off'
             
         print("Đang khởi tạo EasyOCR... (Lần đầu tiên có thể mất vài phút)")
-        self.reader = easyocr.Reader(languages, gpu=gpu)
+        # quantize=True: EasyOCR tự lượng tử hóa động (INT8) Linear/LSTM trên CPU
+        self.reader = easyocr.Reader(languages, gpu=gpu, quantize=quantization != 'off')
         self.allowlist = OCRConfig.ALLOWLIST
+        self.quantization = quantization
+        self.quantized_modules = []
+        if quantization == 'static':
+            self._quantize_static()
         print("EasyOCR đã sẵn sàng!")
     
+    def _quantize_static(self):
+        """
+        Lượng tử hóa tĩnh (INT8) phần convolution của CRAFT và recognizer
+        Hiệu chỉnh (calibration) bằng cách OCR các biển số cắt từ tập train;
+        không có ảnh hiệu chỉnh hoặc lỗi => giữ nguyên mô hình (fallback)
+        """
+        crops = load_plate_crops(limit=OCRConfig.QUANTIZATION_CALIBRATION_CROPS)
+        if not crops:
+            print("⚠️ Không có ảnh hiệu chỉnh - bỏ qua lượng tử hóa tĩnh")
+            self._fallback_dynamic()
+            return
+        
+        def calibrate():
+            for _, crop in crops:
+                self.read_text(crop)
+        
+        try:
+            # Lỗi calibration / convert: backbone gốc đã được khôi phục, trả về []
+            self.quantized_modules = quantize_reader_static(self.reader, calibrate)
+        except Exception as e:
+            print(f"⚠️ Lượng tử hóa tĩnh lỗi: {e}")
+        if not self.quantized_modules:
+            self._fallback_dynamic()
+    
+    def _fallback_dynamic(self):
+        """Quay về lượng tử hóa động, đảm bảo recognizer thật sự đã INT8"""
+        self.quantization = 'dynamic'
+        try:
+            if not ensure_dynamic_quantization(self.reader):
+                self.quantization = 'off'
+        except Exception as e:
+            print(f"⚠️ Lượng tử hóa động lỗi: {e}")
+            self.quantization = 'off'
+    
+    def _detect_kwargs(self):
+        """Tham số text detection (CRAFT) dùng chung cho read_text và read_text_batch"""
+        # Ảnh đã chuẩn hóa tỉ lệ => không cần phóng to thêm trong EasyOCR
+        if PreprocessingConfig.SCALE_NORMALIZATION:
+            canvas_size = OCRConfig.NORMALIZED_CANVAS_SIZE
+            mag_ratio = OCRConfig.NORMALIZED_MAG_RATIO
+        else:
+            canvas_size = OCRConfig.CANVAS_SIZE
+            mag_ratio = OCRConfig.MAG_RATIO
+        
+        return dict(
+            text_threshold=OCRConfig.TEXT_THRESHOLD,
+            low_text=OCRConfig.LOW_TEXT,
+            link_threshold=OCRConfig.LINK_THRESHOLD,
+            canvas_size=canvas_size,
+            mag_ratio=mag_ratio,
+            slope_ths=OCRConfig.SLOPE_THS,
+            ycenter_ths=OCRConfig.YCENTER_THS,
+            height_ths=OCRConfig.HEIGHT_THS,
+            width_ths=OCRConfig.WIDTH_THS,
+            add_margin=OCRConfig.ADD_MARGIN
+        )
+    
+    def _prepare_input(self, image):
+        """
+        Chuẩn bị input cho EasyOCR
+        Mặc định truyền thẳng numpy uint8 (không copy, không encode JPEG)
+        
+        Args:
+            image: File path (string) hoặc numpy array
+            
+        Returns:
+            Input cho reader (path, ndarray hoặc bytes), None nếu không hỗ trợ
+        """
+        return prepare_ocr_input(image, raw=OCRConfig.RAW_ARRAY_INPUT)
+    
     def read_text(self, image):
         """
         Đọc văn bản từ ảnh biển số
@@ -47,53 +142,135 @@ class LicensePlateDetector:
         Returns:
             Danh sách kết quả OCR
         """
-        import cv2
-        import tempfile
-        import os
-        
-        # Nếu là numpy array, encode thành bytes thay vì lưu file
-        if isinstance(image, np.ndarray):
-            # Đảm bảo ảnh là BGR (3 channels) cho EasyOCR
-            if len(image.shape) == 2:
-                # Nếu là grayscale, convert sang BGR
-                image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
-            
-            # Encode ảnh thành bytes (JPEG format)
-            success, encoded_image = cv2.imencode('.jpg', image)
-            if not success:
-                return []
-            
-            image_input = encoded_image.tobytes()
-            cleanup = False
-        elif isinstance(image, str):
-            image_input = image
-            cleanup = False
-        else:
-            # Unsupported type
+        image_input = self._prepare_input(image)
+        if image_input is None:
             return []
         
-        try:
-            results = self.reader.readtext(
-                image_input,
-                allowlist=self.allowlist,
-                paragraph=False,
-                detail=1,
-                batch_size=10,
-                # Use config values
-                text_threshold=OCRConfig.TEXT_THRESHOLD,
-                low_text=OCRConfig.LOW_TEXT,
-                link_threshold=OCRConfig.LINK_THRESHOLD,
-                canvas_size=OCRConfig.CANVAS_SIZE,
-                mag_ratio=OCRConfig.MAG_RATIO,
-                slope_ths=OCRConfig.SLOPE_THS,
-                ycenter_ths=OCRConfig.YCENTER_THS,
-                height_ths=OCRConfig.HEIGHT_THS,
-                width_ths=OCRConfig.WIDTH_THS,
-                add_margin=OCRConfig.ADD_MARGIN
+        return self.reader.readtext(
+            image_input,
+            allowlist=self.allowlist,
+            paragraph=False,
+            detail=1,
+            batch_size=10,
+            # Use config values
+            **self._detect_kwargs()
+        )
+    
+    def read_text_recognition_only(self, image, two_line=False):
+        """
+        Đọc văn bản chỉ bằng recognizer, bỏ qua text detection (CRAFT)
+        Dùng cho ảnh đã được YOLO cắt sát biển số
+        - Biển 1 dòng (BSD): nhận diện cả ảnh như 1 dòng
+        - Biển 2 dòng (BSV): tách 2 nửa theo projection profile ngang,
+          nhận diện từng dòng rồi ghép lại
+        
+        Args:
+            image: Ảnh biển số (numpy array hoặc file path)
+            two_line: Biển số 2 dòng hay không
+            
+        Returns:
+            Danh sách kết quả OCR (bbox, text, confidence)
+        """
+        image_input = self._prepare_input(image)
+        if image_input is None:
+            return []
+        
+        _, grey = reformat_input(image_input)
+        h, w = grey.shape[:2]
+        
+        # Box format của EasyOCR: [x_min, x_max, y_min, y_max]
+        if two_line:
+            split = find_text_line_split(grey) or h // 2
+            horizontal_list = [[0, w, 0, split], [0, w, split, h]]
+        else:
+            horizontal_list = [[0, w, 0, h]]
+        
+        results = self.reader.recognize(
+            grey,
+            horizontal_list=horizontal_list,
+            free_list=[],
+            allowlist=self.allowlist,
+            detail=1,
+            reformat=False
+        )
+        
+        # Ghép 2 dòng thành 1 kết quả để validate như biển 1 dòng
+        if two_line and len(results) == 2:
+            (_, top_text, top_conf), (_, bottom_text, bottom_conf) = results
+            full_box = [[0, 0], [w, 0], [w, h], [0, h]]
+            results = [(full_box, top_text + bottom_text, (top_conf + bottom_conf) / 2)]
+        
+        return results
+    
+    def read_text_batch(self, images):
+        """
+        Đọc văn bản từ nhiều ảnh cùng lúc (batched)
+        - Text detection: 1 forward pass CRAFT cho mỗi nhóm ảnh cùng kích thước
+        - Recognition: gom tất cả vùng chữ của mọi ảnh, mỗi nhóm cùng độ rộng
+          đầu vào chạy 1 batch
+        
+        Các vùng chữ chỉ được gom khi có cùng độ rộng đầu vào của recognizer,
+        nên padding giống hệt khi gọi read_text từng ảnh => kết quả giống nhau.
+        
+        Args:
+            images: Danh sách ảnh (numpy array hoặc file path)
+            
+        Returns:
+            Danh sách kết quả OCR, mỗi phần tử ứng với 1 ảnh đầu vào
+        """
+        results = [[] for _ in images]
+        
+        # Chuẩn bị input, nhóm theo kích thước để detect theo batch
+        groups = {}
+        for idx, image in enumerate(images):
+            image_input = self._prepare_input(image)
+            if image_input is None:
+                continue
+            color, grey = reformat_input(image_input)
+            groups.setdefault(color.shape, []).append((idx, color, grey))
+        
+        # STEP 1: Text detection theo batch
+        model_height = easyocr.easyocr.imgH
+        crops = []  # (image idx, thứ tự vùng, độ rộng recognizer, (box, crop))
+        for members in groups.values():
+            batch = np.stack([color for _, color, _ in members])
+            horizontal_agg, free_agg = self.reader.detect(
+                batch, reformat=False, **self._detect_kwargs()
             )
-        finally:
-            # No cleanup needed for bytes
-            pass
+            
+            for (idx, _, grey), horizontal_list, free_list in zip(members, horizontal_agg, free_agg):
+                # Giống Reader.recognize trên CPU: mỗi box một lần, ngang trước, xiên sau
+                boxes = [([box], []) for box in horizontal_list] + [([], [box]) for box in free_list]
+                for order, (h_list, f_list) in enumerate(boxes):
+                    image_list, max_width = get_image_list(h_list, f_list, grey, model_height=model_height)
+                    for item in image_list:
+                        crops.append((idx, order, int(max_width), item))
+        
+        if not crops:
+            return results
+        
+        # STEP 2: Recognition theo batch, nhóm theo độ rộng đầu vào
+        ignore_char = ''.join(set(self.reader.character) - set(self.allowlist))
+        buckets = {}
+        for crop in crops:
+            buckets.setdefault(crop[2], []).append(crop)
+        
+        ordered = [[] for _ in images]
+        for max_width, members in buckets.items():
+            texts = get_text(
+                self.reader.character, model_height, max_width,
+                self.reader.recognizer, self.reader.converter,
+                [item for _, _, _, item in members],
+                ignore_char, 'greedy', 5,
+                min(len(members), OCRConfig.RECOGNITION_BATCH_SIZE),
+                0.1, 0.5, 0.003, 0, self.reader.device
+            )
+            for (idx, order, _, _), text in zip(members, texts):
+                ordered[idx].append((order, text))
+        
+        for idx, items in enumerate(ordered):
+            items.sort(key=lambda x: x[0])
+            results[idx] = [text for _, text in items]
         
         return results
     
@@ -105,33 +282,34 @@ class LicensePlateDetector:
         Enhanced version for better confidence
         
         Args:
-            results: Danh sách (text, confidence, valid)
+            results: Danh sách (text, confidence, valid) hoặc VoteAggregator
             
         Returns:
             (best_text, adjusted_confidence)
         """
-        if not results:
+        # Thống kê phiếu bầu tăng dần (dùng chung với nhánh YOLO)
+        if isinstance(results, VoteAggregator):
+            aggregator = results
+        else:
+            aggregator = VoteAggregator.from_results(results)
+        
+        if aggregator.total == 0:
             return "Không phát hiện được biển số", 0.0
         
-        # Lọc kết quả hợp lệ
-        valid_results = [(text, conf) for text, conf, valid in results if valid]
+        leader = aggregator.leader_stats()
         
-        if valid_results:
-            # Đếm votes
-            from collections import Counter
-            text_counts = Counter([text for text, _ in valid_results])
-            most_common_text = text_counts.most_common(1)[0][0]
-            vote_count = text_counts[most_common_text]
-            
-            # Lấy confidences của text được vote nhiều nhất
-            matching_confs = [conf for text, conf in valid_results if text == most_common_text]
+        if leader is not None:
+            # Text được vote nhiều nhất
+            most_common_text = leader.text
+            vote_count = leader.votes
             
-            best_conf = max(matching_confs)
-            avg_conf = sum(matching_confs) / len(matching_confs)
-            median_conf = sorted(matching_confs)[len(matching_confs)//2]
+            # Confidences của text được vote nhiều nhất
+            best_conf = leader.max_conf
+            avg_conf = leader.mean
+            median_conf = leader.median
             
             # Vote bonus - AGGRESSIVE BOOST
-            vote_ratio = vote_count / len(results)
+            vote_ratio = vote_count / aggregator.total
             if vote_ratio >= 0.4:  # Giảm từ 0.5
                 vote_bonus = 0.30  # Tăng mạnh từ 0.20
             elif vote_ratio >= 0.25:  # Giảm từ 0.3
@@ -142,7 +320,7 @@ class LicensePlateDetector:
                 vote_bonus = 0.10  # Tăng từ 0.0
             
             # Consistency bonus - AGGRESSIVE
-            std_dev = np.std(matching_confs) if len(matching_confs) > 1 else 0
+            std_dev = leader.std
             if std_dev < 0.08:  # Nới lỏng từ 0.05
                 consistency_bonus = 0.15  # Tăng từ 0.10
             elif std_dev < 0.15:  # Nới lỏng từ 0.10
@@ -169,7 +347,7 @@ class LicensePlateDetector:
             adjusted_conf = base_score + vote_bonus + consistency_bonus + length_bonus
             
             # BOOST if high vote count
-            if vote_count >= len(results) * 0.6:
+            if vote_count >= aggregator.total * 0.6:
                 adjusted_conf *= 1.15  # 15% boost
             
             # FINAL BOOST: If valid Vietnamese plate detected
@@ -187,11 +365,10 @@ class LicensePlateDetector:
             return most_common_text, adjusted_conf
         
         # Nếu không có kết quả hợp lệ, lấy kết quả có confidence cao nhất
-        all_results = [(text, conf) for text, conf, _ in results]
-        all_results.sort(key=lambda x: x[1], reverse=True)
+        best_text, best_any_conf = aggregator.best_any()
         
         # Penalty cho invalid result
-        return all_results[0][0], all_results[0][1] * 0.5  # Increased penalty
+        return best_text, best_any_conf * 0.5  # Increased penalty
     
     def fix_common_ocr_errors(self, text):
         """
@@ -430,56 +607,265 @@ class LicensePlateDetector:
     
     # Use formatting from utils (removed duplicate)
     
-    def detect_plate(self, images):
+    def _score_ocr_results(self, ocr_results):
         """
-        Phát hiện và nhận diện biển số xe từ nhiều phiên bản ảnh
+        Chấm điểm kết quả OCR của 1 ảnh
         
         Args:
-            images: Danh sách các ảnh biển số (hoặc 1 ảnh)
+            ocr_results: Kết quả OCR của 1 ảnh (không rỗng)
             
         Returns:
-            Tuple (biển số, độ tin cậy, danh sách kết quả OCR)
+            Tuple (biển số đã format, confidence trung bình, hợp lệ)
+        """
+        license_number = self.extract_license_number(ocr_results)
+        formatted_plate = format_vietnamese_plate(license_number)  # Use utils
+        is_valid = validate_vietnamese_plate(formatted_plate)  # Use utils
+        avg_confidence = sum([conf for _, _, conf in ocr_results]) / len(ocr_results)
+        return formatted_plate, avg_confidence, is_valid
+    
+    def _plan_reads(self, images):
+        """
+        Chọn ảnh cần OCR cho mỗi phiên bản theo cực tính chữ
+        - Chữ tối trên nền sáng: chỉ OCR ảnh gốc
+        - Chữ sáng trên nền tối: chỉ OCR ảnh đảo ngược
+        - Không chắc chắn: OCR cả hai (như trước)
+        
+        Args:
+            images: Danh sách ảnh biển số
+            
+        Returns:
+            Danh sách (cực tính, danh sách ảnh cần OCR) cho từng phiên bản
+        """
+        plan = []
+        for img in images:
+            polarity = estimate_text_polarity(img) if PreprocessingConfig.POLARITY_DETECTION else 'ambiguous'
+            reads = []
+            if polarity != 'light_on_dark':
+                reads.append(img)
+            if polarity != 'dark_on_light':
+                reads.append(cv2.bitwise_not(img))
+            plan.append((polarity, reads))
+        return plan
+    
+    def _should_stop(self, aggregator, remaining):
+        """
+        Dừng sớm khi kết quả dẫn đầu khó bị vượt với số lần OCR còn lại
+        (kiểm định tuần tự, sai số EARLY_STOP_ERROR_RATE),
+        hoặc đã đủ phiếu và đạt độ tin cậy cấu hình
+        """
+        if aggregator.is_decided(remaining):
+            return True
+        
+        _, votes, _ = aggregator.leader()
+        if votes >= ConfidenceConfig.EARLY_STOP_MIN_VOTES:
+            _, confidence = self.vote_best_result(aggregator)
+            return confidence >= ConfidenceConfig.EARLY_STOP_CONFIDENCE
+        return False
+    
+    def _detect_plate_impl(self, images, read_many, chunk_size, return_details):
+        """
+        OCR các phiên bản theo từng nhóm, vote tăng dần và dừng sớm
+        
+        Args:
+            images: Danh sách ảnh biển số, VariantStream (OCR chạy trong khi
+                các phiên bản sau còn đang được tạo) hoặc 1 ảnh
+            read_many: Hàm OCR danh sách ảnh -> danh sách kết quả
+            chunk_size: Số phiên bản mỗi lần gọi read_many
+            return_details: Trả thêm dict details
         """
         # Nếu chỉ có 1 ảnh, chuyển thành list
-        if not isinstance(images, list):
+        if isinstance(images, np.ndarray):
             images = [images]
         
-        all_results = []
+        # Lấy phiên bản theo từng nhóm khi cần; số lần OCR còn lại ước lượng
+        # bằng số phiên bản chưa đọc x số lần đọc nhiều nhất của 1 phiên bản
+        variant_iter = iter(images)
+        variants_left = len(images)
+        max_reads = 1
+        polarities = []
+        aggregator = VoteAggregator()
         best_ocr_results = None
+        ocr_calls = 0
+        variants_used = 0
+        stopped_early = False
+        
+        # Phiên bản gần giống hệt phiên bản đã OCR: dùng lại phiếu (trọng số
+        # DEDUP_VOTE_WEIGHT) thay vì OCR lại
+        dedup = VariantDeduplicator()
+        variant_votes = []
+        duplicate_weight = PreprocessingConfig.DEDUP_VOTE_WEIGHT
+        
+        # Tên phiên bản (VariantStream) để thống kê phiên bản nào thắng
+        named = hasattr(images, 'yielded')
+        outcomes = []
+        
+        while True:
+            # VariantStream: compute this chunk's variants in parallel, nothing more
+            if hasattr(images, 'request'):
+                images.request(chunk_size)
+            chunk = list(islice(variant_iter, chunk_size))
+            if not chunk:
+                break
+            chunk_names = (images.yielded[variants_used:variants_used + len(chunk)]
+                           if named else [None] * len(chunk))
+            variants_used += len(chunk)
+            variants_left = max(variants_left - len(chunk), 0)
+            
+            fresh, fresh_names, duplicates = [], [], []
+            for img, name in zip(chunk, chunk_names):
+                match = dedup.match(img, len(variant_votes) + len(fresh))
+                if match is None:
+                    fresh.append(img)
+                    fresh_names.append(name)
+                else:
+                    duplicates.append(match)
+            
+            chunk_plan = self._plan_reads(fresh)
+            polarities.extend(polarity for polarity, _ in chunk_plan)
+            chunk_reads = [img for _, reads in chunk_plan for img in reads]
+            max_reads = max([max_reads] + [len(reads) for _, reads in chunk_plan])
+            ocr_calls += len(chunk_reads)
+            remaining = variants_left * max_reads
+            
+            start = time.perf_counter()
+            chunk_results = read_many(chunk_reads)
+            # Thời gian OCR chia theo số lần đọc của mỗi phiên bản
+            ms_per_read = (time.perf_counter() - start) * 1000.0 / max(len(chunk_reads), 1)
+            for (_, reads), name in zip(chunk_plan, fresh_names):
+                votes = []
+                for ocr_results in chunk_results[:len(reads)]:
+                    if not ocr_results:
+                        continue
+                    formatted_plate, avg_confidence, is_valid = self._score_ocr_results(ocr_results)
+                    votes.append((formatted_plate, avg_confidence, is_valid))
+                    aggregator.add(formatted_plate, avg_confidence, is_valid)
+                    if is_valid and (best_ocr_results is None or avg_confidence > best_ocr_results[1]):
+                        best_ocr_results = (ocr_results, avg_confidence)
+                variant_votes.append((len(reads), votes))
+                outcomes.append((name, [text for text, _, valid in votes if valid],
+                                 ms_per_read * len(reads)))
+                chunk_results = chunk_results[len(reads):]
+            
+            for match in duplicates:
+                reads_saved, votes = variant_votes[match]
+                dedup.ocr_calls_saved += reads_saved
+                for formatted_plate, avg_confidence, is_valid in votes:
+                    aggregator.add(formatted_plate, avg_confidence, is_valid, weight=duplicate_weight)
+            
+            if remaining > 0 and self._should_stop(aggregator, remaining):
+                stopped_early = True
+                break
         
-        # Thử OCR với từng phiên bản ảnh
-        for img in images:
-            # Thử với ảnh gốc
-            ocr_results = self.read_text(img)
-            if ocr_results:
-                license_number = self.extract_license_number(ocr_results)
-                formatted_plate = format_vietnamese_plate(license_number)  # Use utils
-                is_valid = validate_vietnamese_plate(formatted_plate)  # Use utils
-                avg_confidence = sum([conf for _, _, conf in ocr_results]) / len(ocr_results)
-                all_results.append((formatted_plate, avg_confidence, is_valid))
-                if is_valid and (best_ocr_results is None or avg_confidence > best_ocr_results[1]):
-                    best_ocr_results = (ocr_results, avg_confidence)
-            
-            # Thử với ảnh đảo ngược màu
-            inverted = cv2.bitwise_not(img)
-            ocr_results_inv = self.read_text(inverted)
-            if ocr_results_inv:
-                license_number_inv = self.extract_license_number(ocr_results_inv)
-                formatted_plate_inv = format_vietnamese_plate(license_number_inv)  # Use utils
-                is_valid_inv = validate_vietnamese_plate(formatted_plate_inv)  # Use utils
-                avg_confidence_inv = sum([conf for _, _, conf in ocr_results_inv]) / len(ocr_results_inv)
-                all_results.append((formatted_plate_inv, avg_confidence_inv, is_valid_inv))
-                if is_valid_inv and (best_ocr_results is None or avg_confidence_inv > best_ocr_results[1]):
-                    best_ocr_results = (ocr_results_inv, avg_confidence_inv)
+        if dedup.ocr_calls_saved:
+            print(f"Dedup: bỏ qua {dedup.ocr_calls_saved} lần OCR "
+                  f"({dedup.duplicates} phiên bản trùng)")
+        
+        # Dừng sớm: hủy các phiên bản chưa được tạo
+        if hasattr(variant_iter, 'close'):
+            variant_iter.close()
         
         # Vote kết quả tốt nhất
-        best_plate, best_confidence = self.vote_best_result(all_results)
+        best_plate, best_confidence = self.vote_best_result(aggregator)
+        record_outcomes(getattr(images, 'stats_key', None), outcomes, best_plate)
         
         # Lấy OCR results tốt nhất
         final_ocr_results = best_ocr_results[0] if best_ocr_results else []
         
+        if return_details:
+            details = {
+                'polarity': polarities,
+                'ocr_calls': ocr_calls,
+                'variants_used': variants_used,
+                'early_stop': stopped_early,
+                'dedup': dedup.report()
+            }
+            # Phiên bản đã tạo và bộ nhớ ảnh cao nhất (khi nhận VariantStream)
+            if hasattr(images, 'memory_report'):
+                details['memory'] = images.memory_report()
+            return best_plate, best_confidence, final_ocr_results, details
         return best_plate, best_confidence, final_ocr_results
     
+    def detect_plate(self, images, return_details=False):
+        """
+        Phát hiện và nhận diện biển số xe từ nhiều phiên bản ảnh
+        Dừng sớm khi kết quả đã chắc chắn (giống nhánh YOLO)
+        
+        Args:
+            images: Danh sách các ảnh biển số (hoặc 1 ảnh), phiên bản hữu ích đặt trước
+            return_details: Trả thêm dict thông tin (cực tính, số lần OCR, dừng sớm)
+            
+        Returns:
+            Tuple (biển số, độ tin cậy, danh sách kết quả OCR)
+            (+ dict details nếu return_details=True)
+        """
+        return self._detect_plate_impl(
+            images, lambda reads: [self.read_text(img) for img in reads], 1, return_details
+        )
+    
+    def detect_plate_batch(self, images, return_details=False):
+        """
+        Giống detect_plate nhưng OCR nhiều phiên bản (và ảnh đảo ngược) trong
+        một lần gọi read_text_batch => ít forward pass hơn
+        Kiểm tra dừng sớm sau mỗi nhóm OCRConfig.EARLY_STOP_BATCH_VARIANTS phiên bản
+        
+        Args:
+            images: Danh sách các ảnh biển số (hoặc 1 ảnh)
+            return_details: Trả thêm dict thông tin (cực tính, số lần OCR, dừng sớm)
+            
+        Returns:
+            Tuple (biển số, độ tin cậy, danh sách kết quả OCR)
+            (+ dict details nếu return_details=True)
+        """
+        return self._detect_plate_impl(
+            images, self.read_text_batch, OCRConfig.EARLY_STOP_BATCH_VARIANTS, return_details
+        )
+    
+    def detect_plate_candidates(self, candidates, return_details=False):
+        """
+        OCR các ứng viên biển số theo thứ tự điểm, dừng ở ứng viên đầu tiên
+        cho biển hợp lệ với độ tin cậy >= CANDIDATE_ACCEPT_CONFIDENCE
+        (thay cho chạy lại cả pipeline trên ảnh chỉnh tương phản / gamma)
+        
+        Args:
+            candidates: Danh sách (phiên bản, tọa độ, details) từ
+                ImagePreprocessor.preprocess_candidates
+            return_details: Trả thêm dict details
+        
+        Returns:
+            Tuple (biển số, độ tin cậy, danh sách kết quả OCR, tọa độ)
+            (+ dict details nếu return_details=True); biển hợp lệ tốt nhất
+            nếu không ứng viên nào đạt ngưỡng
+        """
+        best = None
+        tried = 0
+        for index, (images, coordinates, candidate_details) in enumerate(candidates):
+            tried += 1
+            plate, confidence, ocr_results, details = self.detect_plate_batch(
+                images, return_details=True
+            )
+            details.update(candidate_details)
+            details['candidate'] = index
+            valid = validate_vietnamese_plate(plate)
+            result = (plate, confidence, ocr_results, coordinates, details)
+            # Ưu tiên biển hợp lệ, sau đó độ tin cậy
+            if best is None or (valid, confidence) > (best[0], best[1][1]):
+                best = (valid, result)
+            if valid and confidence >= PreprocessingConfig.CANDIDATE_ACCEPT_CONFIDENCE:
+                break
+        
+        if best is None:
+            plate, confidence, ocr_results, coordinates, details = (
+                "Không phát hiện được biển số", 0.0, [], None, {}
+            )
+        else:
+            plate, confidence, ocr_results, coordinates, details = best[1]
+        details['candidates_tried'] = tried
+        details['candidates_total'] = len(candidates)
+        
+        if return_details:
+            return plate, confidence, ocr_results, coordinates, details
+        return plate, confidence, ocr_results, coordinates
+    
     def draw_results(self, image, ocr_results):
         """
         Vẽ kết quả OCR lên ảnh
@@ -7,7 +7,7 @@ from PIL import Image, ImageTk
 import cv2
 import os
 from preprocess_image import ImagePreprocessor
-from license_plate_detector import LicensePlateDetector
+from model_registry import get_ocr_detector
 
 
 class LicensePlateApp:
@@ -43,7 +43,7 @@ class LicensePlateApp:
         
         try:
             # Sử dụng cả tiếng Anh và tiếng Việt để tăng độ chính xác
-            self.detector = LicensePlateDetector(languages=['en', 'vi'], gpu=False)
+            self.detector = get_ocr_detector(languages=['en', 'vi'], gpu=False)
             self.status_label.config(text="Sẵn sàng! Hãy chọn ảnh để nhận diện.")
         except Exception as e:
             messagebox.showerror("Lỗi", f"Không thể khởi tạo EasyOCR: {str(e)}")
@@ -256,12 +256,13 @@ class LicensePlateApp:
             self.status_label.config(text="Đang xử lý ảnh...")
             self.root.update()
             
-            # Tiền xử lý ảnh - trả về nhiều phiên bản
-            plate_images, coordinates, processed_image = self.preprocessor.preprocess_for_ocr(
+            # Tiền xử lý ảnh - top-K ứng viên theo độ giống chữ, mỗi ứng viên
+            # nhiều phiên bản (chỉ tạo khi OCR cần)
+            candidates, processed_image = self.preprocessor.preprocess_candidates(
                 self.current_image
             )
             
-            if plate_images is None or not plate_images:
+            if not candidates:
                 messagebox.showinfo(
                     "Thông báo",
                     "Không tìm thấy biển số xe trong ảnh!\n\n" +
@@ -275,8 +276,10 @@ class LicensePlateApp:
             self.status_label.config(text="Đang nhận diện biển số...")
             self.root.update()
             
-            # Nhận diện biển số với nhiều phiên bản ảnh
-            license_number, confidence, ocr_results = self.detector.detect_plate(plate_images)
+            # Nhận diện lần lượt từng ứng viên, dừng ở ứng viên đầu tiên đạt ngưỡng
+            license_number, confidence, ocr_results, coordinates = self.detector.detect_plate_candidates(
+                candidates
+            )
             
             # Hiển thị kết quả
             self.result_label.config(text=license_number)
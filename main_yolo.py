@@ -8,9 +8,10 @@ import cv2
 from pathlib import Path
 
 # Import detectors
-from license_plate_detector import LicensePlateDetector
+from model_registry import get_ocr_detector
 try:
-    from yolo_detector import YOLOPlateDetector, integrate_yolo_detection
+    from model_registry import get_yolo_detector
+    from yolo_detector import integrate_yolo_detection
     YOLO_AVAILABLE = True
 except:
     YOLO_AVAILABLE = False
@@ -68,10 +69,10 @@ class LicensePlateApp:
         self.use_yolo = YOLO_AVAILABLE and Path(self.yolo_model_path).exists()
         
         # Initialize detectors
-        self.ocr_detector = LicensePlateDetector(languages=['en', 'vi'], gpu=False)
+        self.ocr_detector = get_ocr_detector(languages=['en', 'vi'], gpu=False)
         
         if self.use_yolo:
-            self.yolo_detector = YOLOPlateDetector(self.yolo_model_path)
+            self.yolo_detector = get_yolo_detector(self.yolo_model_path)
             detection_method = "YOLO AI Model"
             method_icon = "🚀"
         else:
@@ -341,7 +342,8 @@ class LicensePlateApp:
         return integrate_yolo_detection(
             self.image_path,
             self.ocr_detector,
-            self.yolo_model_path
+            self.yolo_model_path,
+            yolo_detector=self.yolo_detector
         )
     
     def detect_with_opencv(self):
@@ -356,9 +358,9 @@ class LicensePlateApp:
             return
         
         preprocessor = ImagePreprocessor()
-        plate_images, coords, processed = preprocessor.preprocess_for_ocr(image)
+        candidates, _ = preprocessor.preprocess_candidates(image)
         
-        if not plate_images:
+        if not candidates:
             result = "❌ KHÔNG PHÁT HIỆN BIỂN SỐ\n\n"
             result += "💡 Gợi ý cải thiện:\n\n"
             result += "✓ Đảm bảo ảnh rõ nét\n"
@@ -370,7 +372,9 @@ class LicensePlateApp:
             self.status_label.config(text="❌ Không phát hiện")
             return
         
-        license_text, confidence, ocr_results = self.ocr_detector.detect_plate(plate_images)
+        license_text, confidence, _, _, details = self.ocr_detector.detect_plate_candidates(
+            candidates, return_details=True
+        )
         
         if license_text and license_text != "Không phát hiện được biển số":
             self.detected_text = license_text
@@ -380,7 +384,8 @@ class LicensePlateApp:
             result += f"{'='*35}\n\n"
             result += f"🎯 Độ tin cậy: {confidence:.1%}\n"
             result += f"🔧 Phương pháp: OpenCV\n"
-            result += f"📊 Đã xử lý: {len(plate_images)} variants\n\n"
+            result += f"📊 Đã xử lý: {details['variants_used']} variants, "
+            result += f"ứng viên {details['candidate'] + 1}/{details['candidates_total']}\n\n"
             result += f"💡 Tính năng đã sử dụng:\n"
             result += f"  • Smart digit correction (5/6)\n"
             result += f"  • Auto format dấu\n"
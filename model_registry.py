@@ -0,0 +1,185 @@
+"""
+Model registry - load YOLO and EasyOCR weights once per process
+- Lazy loading on first use
+- Reuse keyed by (model path, languages, device)
+- Explicit warm-up for servers / GUI start-up
+"""
+import os
+import threading
+
+import numpy as np
+
+from config import DetectionConfig, OCRConfig
+
+
+class ModelRegistry:
+    """Process-wide cache of loaded detectors"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._models = {}
+
+    @staticmethod
+    def ocr_key(languages=None, gpu=None):
+        """
+        Build cache key for an OCR detector
+
+        Args:
+            languages: Language list (default from config)
+            gpu: Use GPU or not (default from config)
+
+        Returns:
+            tuple: ('ocr', languages, device, quantization)
+        """
+        if languages is None:
+            languages = OCRConfig.LANGUAGES
+        if gpu is None:
+            gpu = OCRConfig.USE_GPU
+        return ('ocr', tuple(languages), 'cuda' if gpu else 'cpu', OCRConfig.QUANTIZATION)
+
+    @staticmethod
+    def yolo_key(model_path=None, device=None):
+        """
+        Build cache key for a YOLO detector
+
+        Args:
+            model_path: Path to weights (default from config)
+            device: Inference device (default from config)
+
+        Returns:
+            tuple: ('yolo', absolute model path, device, backend)
+        """
+        if model_path is None:
+            model_path = DetectionConfig.YOLO_MODEL_PATH
+        if device is None:
+            device = DetectionConfig.YOLO_DEVICE
+        return ('yolo', os.path.abspath(str(model_path)), str(device),
+                DetectionConfig.YOLO_BACKEND)
+
+    def _get_or_load(self, key, loader):
+        """Return cached model for key, loading it at most once"""
+        model = self._models.get(key)
+        if model is not None:
+            return model
+
+        # One lock per key: loading YOLO does not block an OCR lookup
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            model = self._models.get(key)
+            if model is None:
+                model = loader()
+                self._models[key] = model
+        return model
+
+    def get_ocr_detector(self, languages=None, gpu=None):
+        """
+        Get shared LicensePlateDetector (EasyOCR reader loaded once)
+
+        Args:
+            languages: Language list (default from config)
+            gpu: Use GPU or not (default from config)
+
+        Returns:
+            LicensePlateDetector
+        """
+        from license_plate_detector import LicensePlateDetector
+
+        key = self.ocr_key(languages, gpu)
+        _, langs, device, quantization = key
+        return self._get_or_load(
+            key, lambda: LicensePlateDetector(languages=list(langs), gpu=(device == 'cuda'),
+                                              quantization=quantization)
+        )
+
+    def get_yolo_detector(self, model_path=None, device=None):
+        """
+        Get shared YOLOPlateDetector (weights loaded once)
+
+        A detector whose weights failed to load is cached too, so a
+        missing best.pt is not retried on every request.
+
+        Args:
+            model_path: Path to weights (default from config)
+            device: Inference device (default from config)
+
+        Returns:
+            YOLOPlateDetector
+        """
+        from yolo_detector import YOLOPlateDetector
+
+        key = self.yolo_key(model_path, device)
+        if model_path is None:
+            model_path = DetectionConfig.YOLO_MODEL_PATH
+        return self._get_or_load(
+            key, lambda: YOLOPlateDetector(model_path, device=key[2], backend=key[3])
+        )
+
+    def warm_up(self, yolo_model_path=None, languages=None, gpu=None,
+                load_yolo=True, load_ocr=True, run_inference=True):
+        """
+        Load models ahead of the first request
+
+        Args:
+            yolo_model_path: Path to YOLO weights (default from config)
+            languages: OCR languages (default from config)
+            gpu: OCR on GPU or not (default from config)
+            load_yolo: Load the YOLO detector
+            load_ocr: Load the EasyOCR reader
+            run_inference: Run one dummy inference so lazy framework
+                initialisation is paid now, not by the first request
+
+        Returns:
+            dict: Loaded detectors {'yolo': ..., 'ocr': ...}
+        """
+        loaded = {}
+
+        if load_yolo:
+            yolo = self.get_yolo_detector(yolo_model_path)
+            if run_inference and yolo.available:
+                yolo.detect_plates(np.zeros((416, 416, 3), dtype=np.uint8))
+            loaded['yolo'] = yolo
+
+        if load_ocr:
+            ocr = self.get_ocr_detector(languages, gpu)
+            if run_inference:
+                ocr.read_text(np.full((64, 256), 255, dtype=np.uint8))
+            loaded['ocr'] = ocr
+
+        return loaded
+
+    def loaded_keys(self):
+        """List keys of currently loaded models"""
+        return list(self._models.keys())
+
+    def clear(self):
+        """Drop all cached models (next lookup reloads from disk)"""
+        with self._lock:
+            self._models.clear()
+            self._key_locks.clear()
+
+
+# Process-wide registry
+_registry = ModelRegistry()
+
+
+def get_registry():
+    """Return the process-wide ModelRegistry"""
+    return _registry
+
+
+def get_ocr_detector(languages=None, gpu=None):
+    """Shortcut for get_registry().get_ocr_detector()"""
+    return _registry.get_ocr_detector(languages, gpu)
+
+
+def get_yolo_detector(model_path=None, device=None):
+    """Shortcut for get_registry().get_yolo_detector()"""
+    return _registry.get_yolo_detector(model_path, device)
+
+
+def warm_up(**kwargs):
+    """Shortcut for get_registry().warm_up()"""
+    return _registry.warm_up(**kwargs)
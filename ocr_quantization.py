@@ -0,0 +1,175 @@
+"""
+INT8 quantization of the EasyOCR models for CPU inference
+- dynamic: Linear / LSTM layers (EasyOCR's own Reader(quantize=True))
+- static: the convolutional backbones as well (CRAFT VGG16-BN, recognizer
+  feature extractor), FX graph mode, calibrated on real plate crops
+- Validation plate crops cut from the YOLO dataset labels (calibration and
+  the parity report in benchmark_ocr_quantization.py)
+"""
+import copy
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from config import OCRConfig
+from utils import rectify_plate
+
+
+QUANTIZATION_MODES = ('off', 'dynamic', 'static')
+CLASS_NAMES = ('BSD', 'BSV')
+
+
+def _label_quad(values, width, height):
+    """4 corners (pixels) of a YOLO label line: polygon or cx cy w h"""
+    if len(values) >= 8:
+        quad = np.asarray(values[:8], dtype=np.float32).reshape(4, 2)
+    else:
+        cx, cy, w, h = values[:4]
+        quad = np.array([[cx - w / 2, cy - h / 2], [cx + w / 2, cy - h / 2],
+                         [cx + w / 2, cy + h / 2], [cx - w / 2, cy + h / 2]],
+                        dtype=np.float32)
+    return quad * np.array([width, height], dtype=np.float32)
+
+
+def load_plate_crops(images_dir=None, limit=None):
+    """
+    Plate crops cut from a YOLO dataset split using its label files
+
+    Labels are read from labels/<split>/<stem>.txt next to images/<split>;
+    each labelled plate is rectified to the canonical size of its class.
+
+    Args:
+        images_dir: images/<split> directory
+            (default OCRConfig.QUANTIZATION_CALIBRATION_DIR)
+        limit: Maximum number of crops
+
+    Returns:
+        list: (name, crop) tuples
+    """
+    if images_dir is None:
+        images_dir = OCRConfig.QUANTIZATION_CALIBRATION_DIR
+    images_dir = Path(images_dir)
+    labels_dir = images_dir.parent.parent / 'labels' / images_dir.name
+
+    crops = []
+    for image_path in sorted(images_dir.glob('*.jpg')):
+        label_path = labels_dir / f"{image_path.stem}.txt"
+        if not label_path.exists():
+            continue
+        image = cv2.imread(str(image_path))
+        if image is None:
+            continue
+        height, width = image.shape[:2]
+        with open(label_path, 'r', encoding='utf-8') as f:
+            lines = [line.split() for line in f if line.strip()]
+        for i, fields in enumerate(lines):
+            cls = int(float(fields[0]))
+            quad = _label_quad([float(v) for v in fields[1:]], width, height)
+            plate_type = CLASS_NAMES[cls] if cls < len(CLASS_NAMES) else None
+            crop, _ = rectify_plate(image, quad, plate_type)
+            crops.append((f"{image_path.stem}_{i}", crop))
+            if limit is not None and len(crops) >= limit:
+                return crops
+    return crops
+
+
+def _set_engine():
+    """Select the quantized kernel backend (fbgemm on x86, qnnpack on ARM)"""
+    import torch
+
+    engine = OCRConfig.QUANTIZATION_ENGINE
+    if engine is None:
+        supported = torch.backends.quantized.supported_engines
+        engine = 'fbgemm' if 'fbgemm' in supported else 'qnnpack'
+    torch.backends.quantized.engine = engine
+    return engine
+
+
+def _prepare_static(module, example_input, engine):
+    """FX-trace a float module and insert observers"""
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx
+
+    module.eval()
+    return prepare_fx(module, get_default_qconfig_mapping(engine), (example_input,))
+
+
+def quantize_reader_static(reader, calibrate):
+    """
+    Statically quantize the convolutional backbones of an EasyOCR reader
+
+    Observers are inserted into the CRAFT backbone (reader.detector.basenet)
+    and the recognizer feature extractor; calibrate() then runs ordinary OCR
+    so the observers see the real input distribution, and the observed
+    modules are converted to INT8 in place. Inputs and outputs stay float,
+    so the rest of EasyOCR is unchanged. A backbone that cannot be traced
+    is left as it was; if calibration or conversion fails, every backbone
+    is restored and nothing is quantized.
+
+    Args:
+        reader: easyocr.Reader loaded on CPU
+        calibrate: Callable running OCR over calibration crops
+
+    Returns:
+        list: Names of the quantized backbones
+    """
+    import torch
+    from torch.ao.quantization.quantize_fx import convert_fx
+
+    engine = _set_engine()
+    targets = [
+        ('detector', reader.detector, 'basenet', torch.zeros(1, 3, 64, 64)),
+        ('recognizer', reader.recognizer, 'FeatureExtraction', torch.zeros(1, 1, 64, 128)),
+    ]
+
+    prepared = []
+    for name, parent, attr, example in targets:
+        original = getattr(parent, attr)
+        try:
+            # Prepare a copy: the original must survive a failed calibration
+            setattr(parent, attr, _prepare_static(copy.deepcopy(original), example, engine))
+            prepared.append((name, parent, attr, original))
+        except Exception as e:
+            print(f"⚠️ Static quantization skipped for {name}: {e}")
+
+    if not prepared:
+        return []
+
+    try:
+        with torch.no_grad():
+            calibrate()
+        converted = [convert_fx(getattr(parent, attr)) for _, parent, attr, _ in prepared]
+    except Exception as e:
+        # Observed-but-unconverted modules are slower than fp32: restore
+        for _, parent, attr, original in prepared:
+            setattr(parent, attr, original)
+        print(f"⚠️ Static quantization failed, backbones restored: {e}")
+        return []
+
+    for (_, parent, attr, _), module in zip(prepared, converted):
+        setattr(parent, attr, module)
+    return [name for name, _, _, _ in prepared]
+
+
+def ensure_dynamic_quantization(reader):
+    """
+    Dynamic INT8 quantization (Linear / LSTM) of the recognizer, as
+    Reader(quantize=True) does; applied only if it is not already in place
+    (EasyOCR silently skips it when quantize_dynamic fails)
+
+    Args:
+        reader: easyocr.Reader loaded on CPU
+
+    Returns:
+        bool: The recognizer has dynamically quantized layers
+    """
+    import torch
+    from torch.ao.nn.quantized import dynamic as nnqd
+
+    def quantized(model):
+        return any(isinstance(m, (nnqd.Linear, nnqd.LSTM)) for m in model.modules())
+
+    if not quantized(reader.recognizer):
+        torch.quantization.quantize_dynamic(reader.recognizer, dtype=torch.qint8, inplace=True)
+    return quantized(reader.recognizer)
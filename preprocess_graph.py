@@ -0,0 +1,402 @@
+"""
+Preprocessing DAG - named image operations with memoized intermediates
+- Each node is computed at most once per graph (lazy, on first request)
+- Variants are just named nodes, so shared prefixes are computed once
+- Optional content-hash memo for expensive pure functions (enhance_plate)
+- VariantStream: variants computed lazily on a shared thread pool with a
+  bounded prefetch window, yielded in order, peak memory accounted
+- VariantDeduplicator: skip OCR of near-identical variants (fingerprints)
+"""
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from config import PreprocessingConfig
+from utils import image_digest, image_fingerprint, fingerprint_distance
+
+
+class PreprocessGraph:
+    """Lazy DAG of named image operations"""
+
+    def __init__(self):
+        self._nodes = {}
+        self._values = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+
+    def set(self, name, value):
+        """
+        Add a source node with a known value
+
+        Args:
+            name: Node name
+            value: Node value (image)
+        """
+        self._values[name] = value
+
+    def add(self, name, func, *deps):
+        """
+        Add an operation node
+
+        Args:
+            name: Node name
+            func: Callable taking the values of deps as positional arguments
+            deps: Names of the input nodes
+        """
+        self._nodes[name] = (func, deps)
+
+    def get(self, name):
+        """
+        Value of a node, computing its inputs first if needed
+
+        Args:
+            name: Node name
+
+        Returns:
+            Node value (None if the operation does not apply)
+        """
+        if name in self._values:
+            self.hits += 1
+            return self._values[name]
+
+        # One lock per node: concurrent variants wait for a shared input
+        # instead of computing it twice. Locks are taken along DAG edges
+        # only, so they cannot deadlock.
+        with self._lock:
+            node_lock = self._locks.setdefault(name, threading.Lock())
+
+        with node_lock:
+            if name in self._values:
+                self.hits += 1
+                return self._values[name]
+            func, deps = self._nodes[name]
+            value = func(*[self.get(dep) for dep in deps])
+            self._values[name] = value
+        return value
+
+    def compute(self, name):
+        """
+        Value of a node without keeping it (its inputs are still memoized)
+
+        Used for leaf nodes (variants): once OCR has consumed a variant
+        nothing else needs it, so the graph must not hold on to it.
+
+        Args:
+            name: Node name
+
+        Returns:
+            Node value (None if the operation does not apply)
+        """
+        if name in self._values:
+            return self.get(name)
+        func, deps = self._nodes[name]
+        return func(*[self.get(dep) for dep in deps])
+
+    def __contains__(self, name):
+        return name in self._nodes or name in self._values
+
+    def nbytes(self):
+        """Bytes held by memoized intermediates"""
+        return sum(image_nbytes(value) for value in list(self._values.values()))
+
+    def stats(self):
+        """Nodes computed and memo hits (for details / benchmarks)"""
+        return {'nodes_computed': len(self._values), 'memo_hits': self.hits}
+
+
+def image_nbytes(value):
+    """Bytes of an image, an (image, name) tuple or None"""
+    if value is None:
+        return 0
+    if isinstance(value, tuple):
+        return sum(image_nbytes(item) for item in value if not isinstance(item, str))
+    return getattr(value, 'nbytes', 0)
+
+
+class ContentMemo:
+    """Bounded LRU cache keyed by image content (plus extra hashable args)"""
+
+    def __init__(self, func, max_size=32):
+        self.func = func
+        self.max_size = max_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._pending = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, image, *args):
+        key = (image_digest(image), args)
+        with self._lock:
+            result = self._cache.get(key)
+            if result is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return result
+            key_lock = self._pending.setdefault(key, threading.Lock())
+
+        # Same content requested by two threads: the second one waits
+        with key_lock:
+            with self._lock:
+                result = self._cache.get(key)
+                if result is not None:
+                    self.hits += 1
+                    return result
+                self.misses += 1
+
+            try:
+                result = self.func(image, *args)
+                with self._lock:
+                    self._cache[key] = result
+                    if len(self._cache) > self.max_size:
+                        self._cache.popitem(last=False)
+            finally:
+                with self._lock:
+                    self._pending.pop(key, None)
+        return result
+
+    def nbytes(self):
+        """Bytes held by cached results"""
+        with self._lock:
+            return sum(image_nbytes(value) for value in self._cache.values())
+
+    def clear(self):
+        """Drop all cached results"""
+        with self._lock:
+            self._cache.clear()
+
+
+# Shared pool for variant generation (created on first use)
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_variant_executor():
+    """
+    Process-wide thread pool for variant generation
+
+    The heavy OpenCV calls (fastNlMeansDenoising, bilateralFilter, inpaint)
+    release the GIL, so threads scale across cores.
+
+    Returns:
+        ThreadPoolExecutor, or None when PreprocessingConfig.VARIANT_WORKERS <= 1
+    """
+    global _executor
+    workers = PreprocessingConfig.VARIANT_WORKERS
+    if workers is None or workers <= 1:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=workers,
+                                           thread_name_prefix='variant')
+    return _executor
+
+
+class VariantStream:
+    """
+    Variants produced lazily and yielded in a fixed order
+
+    Variants are computed on demand, in parallel on the shared pool, and at
+    most prefetch + 1 variant images are alive at a time. A variant is only
+    started once the consumer asked for it: by pulling it, or in advance
+    with request(n) (e.g. the next OCR batch), so after an early stop no
+    further variant is computed. With `speculative` the stream instead keeps
+    `prefetch` variants ahead of the consumer: lower latency, but variants
+    started before an early stop are computed for nothing (reported as
+    'wasted'). Tasks returning None are skipped, so len() is an upper bound.
+    """
+
+    def __init__(self, tasks, executor=None, prefetch=None, resident=None, stats_key=None,
+                 speculative=None):
+        """
+        Args:
+            tasks: List of (name, callable) in the order to yield
+            executor: Thread pool (default: get_variant_executor(); None
+                runs tasks lazily in the calling thread)
+            prefetch: Variants computed ahead of the consumer
+                (default PreprocessingConfig.VARIANT_PREFETCH)
+            resident: Callable -> bytes of shared intermediates held for
+                this plate (counted in the peak memory report)
+            stats_key: (pipeline, quality) under which consumers record
+                per-variant outcomes (variant_stats), or None
+            speculative: Prefetch beyond what the consumer requested
+                (default PreprocessingConfig.VARIANT_SPECULATIVE_PREFETCH)
+        """
+        self.tasks = list(tasks)
+        self.stats_key = stats_key
+        self.executor = executor if executor is not None else get_variant_executor()
+        if prefetch is None:
+            prefetch = PreprocessingConfig.VARIANT_PREFETCH
+        self.prefetch = max(1, prefetch)
+        if speculative is None:
+            speculative = PreprocessingConfig.VARIANT_SPECULATIVE_PREFETCH
+        self.speculative = speculative
+        self.resident = resident
+        self.yielded = []
+        self.computed = 0
+        self.consumed = 0
+        self.requested = 0
+        self.peak_bytes = 0
+        self._refill = None
+
+    @property
+    def names(self):
+        """Planned variant names, in order"""
+        return [name for name, _ in self.tasks]
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def request(self, count):
+        """
+        Allow the next `count` variants to be computed ahead of the consumer
+
+        Args:
+            count: Variants the consumer is about to pull (e.g. its OCR batch)
+        """
+        self.requested = max(self.requested, self.consumed + count)
+        # Start them now, so they are computed while the consumer runs OCR
+        if self._refill is not None:
+            self._refill(pulling=False)
+
+    def _track(self, current, window=()):
+        """Update peak bytes: intermediates + current variant + finished prefetched ones"""
+        held = image_nbytes(current)
+        for _, future in window:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                held += image_nbytes(future.result())
+        if self.resident is not None:
+            held += self.resident()
+        self.peak_bytes = max(self.peak_bytes, held)
+
+    def __iter__(self):
+        # Reset here, not in the generator: request() right after iter() counts
+        self.yielded = []
+        self.computed = 0
+        self.consumed = 0
+        self.requested = 0
+        self.peak_bytes = 0
+        return self._produce()
+
+    def _produce(self):
+        if self.executor is None:
+            for name, func in self.tasks:
+                value = func()
+                self.computed += 1
+                self.consumed += 1
+                self._track(value)
+                if value is not None:
+                    self.yielded.append(name)
+                    yield value
+                value = None
+            return
+
+        pending = iter(self.tasks)
+        window = deque()
+        submitted = 0
+
+        def refill(pulling):
+            # Allowed: requested variants, plus the one being pulled now
+            nonlocal submitted
+            allowed = len(self.tasks) if self.speculative else max(
+                self.requested, self.consumed + (1 if pulling else 0))
+            while len(window) < self.prefetch and submitted < allowed:
+                task = next(pending, None)
+                if task is None:
+                    return
+                name, func = task
+                window.append((name, self.executor.submit(func)))
+                submitted += 1
+
+        self._refill = refill
+        try:
+            while True:
+                refill(pulling=True)
+                if not window:
+                    return
+                name, future = window.popleft()
+                value = future.result()
+                self.computed += 1
+                self.consumed += 1
+                # Start the next requested variants before handing this one to OCR
+                refill(pulling=False)
+                self._track(value, window)
+                if value is not None:
+                    self.yielded.append(name)
+                    yield value
+                value = None
+        finally:
+            self._refill = None
+            for _, future in window:
+                if not future.cancel():
+                    self.computed += 1
+
+    def memory_report(self):
+        """
+        Variants computed and peak image memory for this plate
+
+        Returns:
+            dict: planned, computed, yielded, wasted (computed but never
+                handed to the consumer: started before an early stop),
+                peak_bytes
+        """
+        return {
+            'planned': len(self.tasks),
+            'computed': self.computed,
+            'yielded': len(self.yielded),
+            'wasted': self.computed - self.consumed,
+            'peak_bytes': self.peak_bytes
+        }
+
+
+class VariantDeduplicator:
+    """
+    Near-duplicate detection over the variants of one plate
+
+    Each variant is fingerprinted (utils.image_fingerprint); a variant close
+    enough to an earlier OCR'd one is reported as its duplicate so the caller
+    can reuse that variant's votes instead of running OCR again.
+    """
+
+    def __init__(self, max_distance=None, enabled=None):
+        """
+        Args:
+            max_distance: Max fingerprint distance of a duplicate
+                (default PreprocessingConfig.DEDUP_MAX_DISTANCE)
+            enabled: Dedup on/off (default PreprocessingConfig.DEDUP_VARIANTS)
+        """
+        if max_distance is None:
+            max_distance = PreprocessingConfig.DEDUP_MAX_DISTANCE
+        if enabled is None:
+            enabled = PreprocessingConfig.DEDUP_VARIANTS
+        self.max_distance = max_distance
+        self.enabled = enabled
+        self.fingerprints = []
+        self.duplicates = 0
+        self.ocr_calls_saved = 0
+
+    def match(self, image, key):
+        """
+        Find an earlier variant this one duplicates; register it otherwise
+
+        Args:
+            image: Variant image
+            key: Identifier of this variant (returned for later duplicates)
+
+        Returns:
+            Key of the earlier near-identical variant, or None
+        """
+        if not self.enabled:
+            return None
+        fingerprint = image_fingerprint(image)
+        for other_key, other in self.fingerprints:
+            if fingerprint_distance(fingerprint, other) <= self.max_distance:
+                self.duplicates += 1
+                return other_key
+        self.fingerprints.append((key, fingerprint))
+        return None
+
+    def report(self):
+        """Duplicates found and OCR calls saved for this plate"""
+        return {'duplicates': self.duplicates, 'ocr_calls_saved': self.ocr_calls_saved}
@@ -2,10 +2,49 @@
 Module xử lý tiền xử lý ảnh cho nhận diện biển số xe
 Optimized version with config
 """
+import heapq
+
 import cv2
 import numpy as np
 from config import PreprocessingConfig, ValidationConfig
-from utils import calculate_image_quality, resize_if_needed, ensure_bgr
+from utils import (
+    calculate_image_quality, resize_if_needed, ensure_bgr, normalize_plate_scale,
+    get_clahe, gamma_lut, morph_kernel, sharpen_kernel,
+    analyze_plate, plan_plate_stages, skipped_stages, estimate_skew_angle,
+    rectify_plate, quad_corner_offset, text_likeness, plate_color_mask, color_plate_rois
+)
+from preprocess_graph import PreprocessGraph, ContentMemo, VariantStream
+from variant_stats import get_variant_stats
+
+
+def _scale_contour(contour, scale, offset=(0, 0)):
+    """Contour tọa độ mức kim tự tháp -> tọa độ ảnh gốc"""
+    scaled = contour.astype(np.float64) * scale + np.asarray(offset, dtype=np.float64)
+    return np.round(scaled).astype(np.int32)
+
+
+def _box_iou(box1, box2):
+    """IoU của 2 bounding box (x, y, w, h)"""
+    x1, y1 = max(box1[0], box2[0]), max(box1[1], box2[1])
+    x2 = min(box1[0] + box1[2], box2[0] + box2[2])
+    y2 = min(box1[1] + box1[3], box2[1] + box2[3])
+    inter = max(0, x2 - x1) * max(0, y2 - y1)
+    union = box1[2] * box1[3] + box2[2] * box2[3] - inter
+    return inter / union if union > 0 else 0.0
+
+
+def _distinct_contours(contours, top_k=None):
+    """Bỏ contour trùng vị trí với contour đứng trước (IoU > CANDIDATE_MAX_OVERLAP)"""
+    kept, boxes = [], []
+    for contour in contours:
+        box = cv2.boundingRect(contour)
+        if any(_box_iou(box, other) > PreprocessingConfig.CANDIDATE_MAX_OVERLAP for other in boxes):
+            continue
+        kept.append(contour)
+        boxes.append(box)
+        if top_k is not None and len(kept) >= top_k:
+            break
+    return kept
 
 
 class ImagePreprocessor:
@@ -13,6 +52,10 @@ class ImagePreprocessor:
     
     def __init__(self, debug=False):
         self.debug = debug
+        # enhance_plate theo nội dung ảnh xám: cùng đầu vào => tính 1 lần
+        self._enhance_memo = ContentMemo(
+            self._enhance_gray, PreprocessingConfig.ENHANCE_CACHE_SIZE
+        )
         if debug:
             import os
             self.debug_dir = "d:\\game\\debug"
@@ -20,7 +63,10 @@ class ImagePreprocessor:
     
     def deskew_image(self, image):
         """
-        Sửa ảnh bị nghêng
+        Sửa ảnh bị nghêng (cả khung hình, Hough lines)
+        
+        Chỉ dùng khi PreprocessingConfig.DESKEW_PLATE = False; mặc định
+        sửa nghêng trên crop biển số (deskew_plate).
         
         Args:
             image: Ảnh đầu vào
@@ -67,6 +113,29 @@ class ImagePreprocessor:
         
         return image
     
+    def deskew_plate(self, plate_image):
+        """
+        Sửa nghêng crop biển số (tìm góc theo projection profile)
+        
+        Góc lấy từ chính các dòng ký tự thay vì đường thẳng của cả khung
+        hình (đường, tòa nhà), và chỉ xoay crop nhỏ.
+        
+        Args:
+            plate_image: Ảnh biển số
+            
+        Returns:
+            Tuple (ảnh đã sửa nghêng, góc xoay theo độ)
+        """
+        angle = estimate_skew_angle(plate_image)
+        if abs(angle) < PreprocessingConfig.DESKEW_MIN_ANGLE:
+            return plate_image, 0.0
+        
+        (h, w) = plate_image.shape[:2]
+        M = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+        rotated = cv2.warpAffine(plate_image, M, (w, h), flags=cv2.INTER_CUBIC,
+                                 borderMode=cv2.BORDER_REPLICATE)
+        return rotated, angle
+    
     def reduce_glare(self, image):
         """
         Giảm phản chiếu ánh sáng
@@ -101,10 +170,8 @@ class ImagePreprocessor:
         Returns:
             Ảnh đã được làm sắc nét
         """
-        # Kernel sharpen với cường độ tùy chỉnh
-        kernel = np.array([[-1, -1, -1],
-                          [-1, strength, -1],
-                          [-1, -1, -1]])
+        # Kernel sharpen với cường độ tùy chỉnh (cache theo strength)
+        kernel = sharpen_kernel(strength)
         sharpened = cv2.filter2D(image, -1, kernel)
         return sharpened
     
@@ -188,45 +255,46 @@ class ImagePreprocessor:
         Returns:
             Mask của vùng biển số hoặc None
         """
-        # Chuyển sang HSV
-        hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
-        
-        # Range 1: Màu trắng tiêu chuẩn
-        lower_white1 = np.array([0, 0, 180])
-        upper_white1 = np.array([180, 30, 255])
-        mask1 = cv2.inRange(hsv, lower_white1, upper_white1)
-        
-        # Range 2: Màu trắng ngà (vàng nhạt)
-        lower_white2 = np.array([15, 0, 170])
-        upper_white2 = np.array([30, 40, 255])
-        mask2 = cv2.inRange(hsv, lower_white2, upper_white2)
-        
-        # Range 3: Màu bạc/xám sáng
-        lower_gray = np.array([0, 0, 150])
-        upper_gray = np.array([180, 50, 200])
-        mask3 = cv2.inRange(hsv, lower_gray, upper_gray)
-        
-        # Kết hợp các mask
-        mask = cv2.bitwise_or(mask1, mask2)
-        mask = cv2.bitwise_or(mask, mask3)
-        
-        # Morphological operations để làm sạch
-        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (7, 7))
-        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, iterations=2)
-        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, iterations=1)
+        return plate_color_mask(image)
+    
+    def propose_plate_rois(self, image):
+        """
+        Vùng cần tìm biển số theo mask màu (find_plate_by_color trên ảnh nhỏ)
         
-        return mask
+        Args:
+            image: Ảnh đầu vào (màu)
+            
+        Returns:
+            Danh sách (x, y, w, h) theo tọa độ ảnh gốc; rỗng = tìm cả ảnh
+        """
+        return color_plate_rois(image)
     
-    def find_license_plate_contour(self, contours):
+    def find_license_plate_contour(self, contours, min_area=200):
         """
         Tìm contour của biển số xe với nhiều tiêu chí
         
         Args:
             contours: Danh sách contours
+            min_area: Diện tích tối thiểu (px, ở ảnh rộng 800px)
             
         Returns:
             Contour của biển số xe hoặc None
         """
+        candidates = self.find_license_plate_contours(contours, min_area, top_k=1)
+        return candidates[0] if candidates else None
+    
+    def find_license_plate_contours(self, contours, min_area=200, top_k=None):
+        """
+        Tìm các contour ứng viên biển số, tốt nhất trước
+        
+        Args:
+            contours: Danh sách contours
+            min_area: Diện tích tối thiểu (px, ở ảnh rộng 800px)
+            top_k: Số ứng viên tối đa (None = tất cả)
+            
+        Returns:
+            Danh sách contour (ứng viên trùng vị trí chỉ giữ 1)
+        """
         license_plate_candidates = []
         
         for contour in contours:
@@ -235,7 +303,7 @@ class ImagePreprocessor:
             area = cv2.contourArea(contour)
             
             # Bỏ qua contour quá nhỏ - GIẢM từ 500 xuống 200
-            if area < 200:
+            if area < min_area:
                 continue
             
             # Xấp xỉ hình dạng
@@ -260,7 +328,7 @@ class ImagePreprocessor:
         if not license_plate_candidates:
             for contour in contours[:15]:  # Xét 15 contour lớn nhất
                 area = cv2.contourArea(contour)
-                if area < 200:
+                if area < min_area:
                     continue
                     
                 x, y, w, h = cv2.boundingRect(contour)
@@ -275,12 +343,169 @@ class ImagePreprocessor:
                     score = area
                     license_plate_candidates.append((rect_contour, score, area))
         
-        # Sắp xếp theo điểm và trả về tốt nhất
-        if license_plate_candidates:
-            license_plate_candidates.sort(key=lambda x: x[1], reverse=True)
-            return license_plate_candidates[0][0]
+        # Sắp xếp theo điểm, bỏ ứng viên trùng vị trí (viền trong / ngoài)
+        license_plate_candidates.sort(key=lambda x: x[1], reverse=True)
+        return _distinct_contours([c[0] for c in license_plate_candidates], top_k)
+    
+    def localize_plate(self, image):
+        """
+        Định vị biển số theo kim tự tháp 2 mức (coarse-to-fine)
+        
+        Args:
+            image: Ảnh gốc (màu)
+            
+        Returns:
+            Contour biển số (tọa độ ảnh gốc) hoặc None
+        """
+        candidates = self.localize_plates(image, top_k=1)
+        return candidates[0] if candidates else None
+    
+    def localize_plates(self, image, top_k=None):
+        """
+        Định vị các ứng viên biển số theo kim tự tháp 2 mức (coarse-to-fine)
+        
+        Mức thô: ảnh nhỏ (LOCALIZE_COARSE_WIDTH), Gaussian thay cho
+        bilateral, chỉ giữ LOCALIZE_MAX_CONTOURS contour lớn nhất. Mức
+        tinh: chỉ vùng quanh từng ứng viên, ở độ phân giải gốc (tối đa
+        LOCALIZE_REFINE_MAX_WIDTH), bằng các bước cũ. Contour trả về theo
+        tọa độ ảnh gốc nên crop giữ toàn bộ điểm ảnh của camera.
+        
+        Args:
+            image: Ảnh gốc (màu)
+            top_k: Số ứng viên tối đa (mặc định CANDIDATE_TOP_K)
+            
+        Returns:
+            Danh sách contour (tọa độ ảnh gốc), tốt nhất trước
+        """
+        if top_k is None:
+            top_k = PreprocessingConfig.CANDIDATE_TOP_K
+        h, w = image.shape[:2]
+        
+        # Mức thô
+        coarse_scale = min(1.0, PreprocessingConfig.LOCALIZE_COARSE_WIDTH / w)
+        coarse = image
+        if coarse_scale < 1.0:
+            # INTER_LINEAR: nhanh hơn INTER_AREA nhiều lần, Gaussian ngay sau đó
+            coarse = cv2.resize(image, (round(w * coarse_scale), round(h * coarse_scale)),
+                                interpolation=cv2.INTER_LINEAR)
+        gray = cv2.GaussianBlur(self.convert_to_grayscale(coarse), (5, 5), 0)
+        contours, _ = cv2.findContours(self.detect_edges(gray), cv2.RETR_LIST,
+                                       cv2.CHAIN_APPROX_SIMPLE)
+        contours = heapq.nlargest(PreprocessingConfig.LOCALIZE_MAX_CONTOURS,
+                                  contours, key=cv2.contourArea)
+        # Ngưỡng diện tích 200px được định nghĩa ở ảnh rộng 800px
+        level_800 = w * coarse_scale / 800
+        coarse_contours = self.find_license_plate_contours(contours, 200 * level_800 ** 2, top_k)
+        
+        # Mức tinh cho từng ứng viên
+        refined = [self._refine_candidate(image, _scale_contour(contour, 1.0 / coarse_scale))
+                   for contour in coarse_contours]
+        return _distinct_contours(refined, top_k)
+    
+    def _refine_candidate(self, image, coarse_contour):
+        """Tinh chỉnh 1 ứng viên thô trên vùng quanh nó, cắt từ ảnh gốc"""
+        h, w = image.shape[:2]
+        x, y, bw, bh = cv2.boundingRect(coarse_contour)
+        margin = PreprocessingConfig.LOCALIZE_REFINE_MARGIN
+        x0 = max(0, int(x - bw * margin))
+        y0 = max(0, int(y - bh * margin))
+        x1 = min(w, int(x + bw * (1 + margin)) + 1)
+        y1 = min(h, int(y + bh * (1 + margin)) + 1)
+        refined = self._find_in_region(image, (x0, y0, x1 - x0, y1 - y0), top_k=1)
+        if not refined:
+            return coarse_contour
+        
+        # Contour tinh phải trùng ứng viên thô (không lấy nhầm vùng xe lớn hơn)
+        if _box_iou(cv2.boundingRect(refined[0]), (x, y, bw, bh)) < 0.5:
+            return coarse_contour
+        return refined[0]
+    
+    def _find_in_region(self, image, region, top_k):
+        """
+        Các bước tinh (bilateral, Canny, contour) trên 1 vùng của ảnh gốc
+        
+        Args:
+            image: Ảnh gốc
+            region: (x, y, w, h) vùng cần tìm
+            top_k: Số ứng viên tối đa
+            
+        Returns:
+            Danh sách contour theo tọa độ ảnh gốc
+        """
+        x0, y0, rw, rh = region
+        roi = image[y0:y0+rh, x0:x0+rw]
+        
+        refine_scale = min(1.0, PreprocessingConfig.LOCALIZE_REFINE_MAX_WIDTH / roi.shape[1])
+        if refine_scale < 1.0:
+            roi = cv2.resize(roi, (round(roi.shape[1] * refine_scale),
+                                   round(roi.shape[0] * refine_scale)),
+                             interpolation=cv2.INTER_AREA)
+        filtered = self.apply_bilateral_filter(self.convert_to_grayscale(roi))
+        contours = self.find_contours(self.detect_edges(filtered))
+        # Ngưỡng diện tích 200px được định nghĩa ở ảnh rộng 800px
+        level_800 = image.shape[1] * refine_scale / 800
+        contours = self.find_license_plate_contours(contours, 200 * level_800 ** 2, top_k)
+        return [_scale_contour(c, 1.0 / refine_scale, (x0, y0)) for c in contours]
+    
+    def find_plate_candidates(self, image, top_k=None):
+        """
+        Ứng viên biển số xếp theo độ giống chữ (utils.text_likeness)
         
-        return None
+        Args:
+            image: Ảnh đầu vào
+            top_k: Số ứng viên tối đa (mặc định CANDIDATE_TOP_K)
+            
+        Returns:
+            Tuple (ảnh chứa contour, danh sách (contour, text_likeness dict)
+            điểm cao nhất trước)
+        """
+        if top_k is None:
+            top_k = PreprocessingConfig.CANDIDATE_TOP_K
+        deskew_plate = PreprocessingConfig.DESKEW_PLATE
+        
+        if PreprocessingConfig.LOCALIZE_PYRAMID:
+            # Định vị crop từ ảnh gốc. Vùng có màu biển số (mask trên ảnh
+            # nhỏ) thay cho mức thô: chỉ chạy bước tinh trong các vùng đó;
+            # không có vùng / không thấy ứng viên => coarse-to-fine cả ảnh
+            # Sửa nghêng: mặc định trên crop biển số sau khi định vị
+            source = image if deskew_plate else self.deskew_image(image)
+            contours = []
+            if PreprocessingConfig.COLOR_ROI_PREFILTER:
+                for roi in self.propose_plate_rois(source):
+                    contours += self._find_in_region(source, roi, top_k)
+                contours = _distinct_contours(contours, top_k)
+            if not contours:
+                contours = self.localize_plates(source, top_k)
+        else:
+            # Resize ảnh
+            resized = self.resize_image(image)
+            
+            # Sửa nghêng: mặc định trên crop biển số sau khi định vị
+            source = resized if deskew_plate else self.deskew_image(resized)
+            
+            # Chuyển sang ảnh xám
+            gray = self.convert_to_grayscale(source)
+            
+            # Lọc nhiễu
+            filtered = self.apply_bilateral_filter(gray)
+            
+            # Phát hiện cạnh
+            edges = self.detect_edges(filtered)
+            
+            # Tìm contours
+            contours = self.find_contours(edges)
+            
+            # Tìm các contour ứng viên biển số
+            contours = self.find_license_plate_contours(contours, top_k=top_k)
+        
+        # Chấm điểm rẻ trên crop (view, không copy); sort ổn định giữ thứ
+        # tự hình học khi bằng điểm
+        candidates = [
+            (contour, text_likeness(self.extract_license_plate(source, contour)[0]))
+            for contour in contours
+        ]
+        candidates.sort(key=lambda c: c[1]['score'], reverse=True)
+        return source, candidates
     
     def extract_license_plate(self, image, contour):
         """
@@ -310,13 +535,34 @@ class ImagePreprocessor:
         
         return license_plate, (x, y, w, h)
     
-    def enhance_plate(self, plate_image):
+    def rectify_license_plate(self, image, contour):
+        """
+        Nắn phối cảnh tứ giác biển số về kích thước chuẩn (BSD / BSV)
+        
+        Args:
+            image: Ảnh gốc
+            contour: Contour 4 đỉnh của biển số xe
+            
+        Returns:
+            Tuple (ảnh biển số đã nắn, loại biển 'BSD' / 'BSV'),
+            hoặc (None, None) nếu contour không phải tứ giác hoặc chỉ là
+            hình chữ nhật thẳng (vd. boundingRect dự phòng): không có gì để
+            nắn, chỉ crop và giữ đủ số phiên bản
+        """
+        if len(contour) != 4:
+            return None, None
+        if quad_corner_offset(contour) < PreprocessingConfig.RECTIFY_MIN_CORNER_OFFSET:
+            return None, None
+        return rectify_plate(image, contour)
+    
+    def enhance_plate(self, plate_image, denoise=True):
         """
         Cải thiện chất lượng ảnh biển số - ENHANCED VERSION
         Tối ưu để OCR đọc tốt hơn
         
         Args:
             plate_image: Ảnh biển số
+            denoise: Khử nhiễu trước CLAHE (bỏ qua với crop đã sạch)
             
         Returns:
             Ảnh biển số đã được cải thiện
@@ -327,9 +573,25 @@ class ImagePreprocessor:
         else:
             gray = plate_image
         
+        # Kết quả chỉ phụ thuộc ảnh xám => dùng lại nếu đã xử lý ảnh giống hệt
+        return self._enhance_memo(gray, denoise)
+    
+    def _enhance_gray(self, gray, denoise=True):
+        """
+        Các bước của enhance_plate trên ảnh xám (hàm thuần, được memo hóa)
+        
+        Args:
+            gray: Ảnh xám biển số
+            denoise: Khử nhiễu trước CLAHE
+            
+        Returns:
+            Ảnh biển số đã được cải thiện
+        """
         # Resize lên nếu ảnh quá nhỏ - AGGRESSIVE
-        target_width = PreprocessingConfig.MIN_RESIZE_WIDTH * 2  # 600px
-        gray = resize_if_needed(gray, target_width)
+        # (bỏ qua khi crop đã được chuẩn hóa tỉ lệ theo chiều cao ký tự)
+        if not PreprocessingConfig.SCALE_NORMALIZATION:
+            target_width = PreprocessingConfig.MIN_RESIZE_WIDTH * 2  # 600px
+            gray = resize_if_needed(gray, target_width)
         
         # Remove border
         h, w = gray.shape
@@ -337,18 +599,21 @@ class ImagePreprocessor:
         if border_size > 2:
             gray = gray[border_size:-border_size, border_size:-border_size]
         
-        # STEP 1: Denoise FIRST
-        denoised = cv2.fastNlMeansDenoising(
-            gray, None,
-            PreprocessingConfig.DENOISE_H,
-            PreprocessingConfig.DENOISE_TEMPLATE_SIZE,
-            PreprocessingConfig.DENOISE_SEARCH_SIZE
-        )
+        # STEP 1: Denoise FIRST (nếu crop có nhiễu)
+        if denoise:
+            denoised = cv2.fastNlMeansDenoising(
+                gray, None,
+                PreprocessingConfig.DENOISE_H,
+                PreprocessingConfig.DENOISE_TEMPLATE_SIZE,
+                PreprocessingConfig.DENOISE_SEARCH_SIZE
+            )
+        else:
+            denoised = gray
         
         # STEP 2: CLAHE - AGGRESSIVE
-        clahe = cv2.createCLAHE(
-            clipLimit=PreprocessingConfig.CLAHE_CLIP_LIMIT * 1.5,  # Boost
-            tileGridSize=PreprocessingConfig.CLAHE_TILE_SIZE
+        clahe = get_clahe(
+            PreprocessingConfig.CLAHE_CLIP_LIMIT * 1.5,  # Boost
+            PreprocessingConfig.CLAHE_TILE_SIZE
         )
         enhanced = clahe.apply(denoised)
         
@@ -387,7 +652,7 @@ class ImagePreprocessor:
         best_thresh = [thresh1, thresh2, thresh3][best_idx]
         
         # STEP 6: Morphological operations - LIGHT
-        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (2, 2))
+        kernel = morph_kernel(cv2.MORPH_RECT, (2, 2))
         morphed = cv2.morphologyEx(best_thresh, cv2.MORPH_CLOSE, kernel, iterations=1)
         
         # STEP 7: Final denoise
@@ -401,119 +666,252 @@ class ImagePreprocessor:
         
         return bordered
     
-    def preprocess_for_ocr(self, image):
+    def build_variant_graph(self, plate_image, normalize=None, stages=None):
         """
-        Xử lý đầy đủ ảnh để chuẩn bị cho OCR với nhiều phương pháp
+        Dựng DAG các phiên bản ảnh biển số cho OCR
+        
+        Mỗi phiên bản là một node có tên; các bước trung gian (ảnh xám, giảm
+        phản chiếu, ...) là node chung nên chỉ tính 1 lần, và enhance_plate
+        được memo hóa theo nội dung ảnh. Kết quả giống hệt từng bit so với
+        cách tạo tuần tự trước đây.
         
         Args:
-            image: Ảnh đầu vào
+            plate_image: Ảnh biển số (đã chuẩn hóa tỉ lệ nếu bật)
+            normalize: Đã chuẩn hóa tỉ lệ hay chưa (default from config)
+            stages: Bước tốn kém được chạy (plan_plate_stages; None = tất cả)
             
         Returns:
-            Tuple (danh sách ảnh biển số, tọa độ, ảnh gốc đã resize)
+            Tuple (PreprocessGraph, danh sách tên phiên bản theo thứ tự ưu tiên)
         """
-        # Resize ảnh
-        resized = self.resize_image(image)
-        
-        # Sửa nghêng
-        deskewed = self.deskew_image(resized)
-        
-        # Chuyển sang ảnh xám
-        gray = self.convert_to_grayscale(deskewed)
+        if normalize is None:
+            normalize = PreprocessingConfig.SCALE_NORMALIZATION
+        if stages is None:
+            stages = plan_plate_stages(None)
         
-        # Lọc nhiễu
-        filtered = self.apply_bilateral_filter(gray)
+        def enhance(img):
+            return self.enhance_plate(img, denoise=stages['denoise'])
         
-        # Phát hiện cạnh
-        edges = self.detect_edges(filtered)
-        
-        # Tìm contours
-        contours = self.find_contours(edges)
+        graph = PreprocessGraph()
+        graph.set('plate', plate_image)
         
-        # Tìm contour biển số xe
-        plate_contour = self.find_license_plate_contour(contours)
+        # Node chung
+        # 0. Giảm phản chiếu trước (nếu có vùng chói)
+        if stages['reduce_glare']:
+            graph.add('deglared', self.reduce_glare, 'plate')
+        else:
+            graph.add('deglared', lambda img: img, 'plate')
+        graph.add('gray', lambda img: cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+                  if len(img.shape) == 3 else img, 'deglared')
+        graph.add('sharpened', self.sharpen_image, 'deglared')
+        graph.add('clahe_strong', lambda gray: get_clahe(5.0, (4, 4)).apply(gray), 'gray')
         
-        if plate_contour is None:
-            return None, None, deskewed
+        names = []
         
-        # Trích xuất biển số
-        plate_image, coordinates = self.extract_license_plate(deskewed, plate_contour)
+        def variant(name, func, *deps):
+            graph.add(name, func, *deps)
+            names.append(name)
         
-        # Tạo nhiều phiên bản xử lý khác nhau
-        plate_variants = []
+        def otsu(img):
+            return cv2.threshold(img, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
         
-        # 0. Giảm phản chiếu trước (nếu có)
-        deglared = self.reduce_glare(plate_image)
-        
-        # 1. Phiên bản chuẩn
-        enhanced_plate = self.enhance_plate(deglared)
-        plate_variants.append(enhanced_plate)
+        # 1. Phiên bản chuẩn (enhance_plate chỉ dùng ảnh xám)
+        variant('enhanced', enhance, 'gray')
         
         # 2. Phiên bản sharpen
-        sharpened = self.sharpen_image(deglared)
-        enhanced_sharp = self.enhance_plate(sharpened)
-        plate_variants.append(enhanced_sharp)
+        variant('enhanced_sharp', enhance, 'sharpened')
         
-        # 3. Phiên bản resize lên 2x (luôn thêm, không chỉ khi nhỏ)
-        large_plate = cv2.resize(deglared, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
-        enhanced_large = self.enhance_plate(large_plate)
-        plate_variants.append(enhanced_large)
+        # 3. Phiên bản resize lên 2x (thừa khi đã chuẩn hóa tỉ lệ)
+        if not normalize:
+            variant('large_2x', lambda img: enhance(
+                cv2.resize(img, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
+            ), 'deglared')
         
         # 4. Phiên bản với CLAHE mạnh hơn
-        if len(deglared.shape) == 3:
-            gray_plate = cv2.cvtColor(deglared, cv2.COLOR_BGR2GRAY)
-        else:
-            gray_plate = deglared
-        clahe_strong = cv2.createCLAHE(clipLimit=5.0, tileGridSize=(4, 4))
-        clahe_applied = clahe_strong.apply(gray_plate)
-        _, binary = cv2.threshold(clahe_applied, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        plate_variants.append(binary)
+        variant('clahe_otsu', otsu, 'clahe_strong')
         
         # 5. Phiên bản gamma correction (tối)
-        gamma = 1.5
-        inv_gamma = 1.0 / gamma
-        table = np.array([((i / 255.0) ** inv_gamma) * 255 for i in range(256)]).astype("uint8")
-        gamma_corrected = cv2.LUT(gray_plate, table)
-        enhanced_gamma = self.enhance_plate(gamma_corrected)
-        plate_variants.append(enhanced_gamma)
+        variant('gamma', lambda gray: enhance(
+            cv2.LUT(gray, gamma_lut(1.5))
+        ), 'gray')
         
         # 6. Phiên bản với nhiều threshold khác nhau
-        _, binary2 = cv2.threshold(gray_plate, 127, 255, cv2.THRESH_BINARY)
-        plate_variants.append(binary2)
+        variant('binary_127', lambda gray: cv2.threshold(
+            gray, 127, 255, cv2.THRESH_BINARY
+        )[1], 'gray')
         
         # 7. Phiên bản với morphological gradient (làm nổi cạnh chữ)
-        kernel_morph = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
-        gradient = cv2.morphologyEx(gray_plate, cv2.MORPH_GRADIENT, kernel_morph)
-        _, binary_grad = cv2.threshold(gradient, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        plate_variants.append(binary_grad)
+        variant('gradient', lambda gray: otsu(cv2.morphologyEx(
+            gray, cv2.MORPH_GRADIENT, morph_kernel(cv2.MORPH_RECT, (3, 3))
+        )), 'gray')
         
         # 8. Phiên bản với bilateral filter + adaptive threshold
-        bilateral = cv2.bilateralFilter(gray_plate, 9, 75, 75)
-        adaptive = cv2.adaptiveThreshold(
-            bilateral, 255, cv2.ADAPTIVE_THRESH_MEAN_C,
+        variant('adaptive', lambda gray: cv2.adaptiveThreshold(
+            cv2.bilateralFilter(gray, 9, 75, 75), 255, cv2.ADAPTIVE_THRESH_MEAN_C,
             cv2.THRESH_BINARY, 11, 2
-        )
-        plate_variants.append(adaptive)
+        ), 'gray')
         
         # 9. Phiên bản resize lớn hơn (400px width cho OCR tốt hơn)
-        if deglared.shape[1] < 400:
-            scale = 400 / deglared.shape[1]
-            large_plate = cv2.resize(deglared, None, fx=scale, fy=scale, 
-                                    interpolation=cv2.INTER_CUBIC)
-            enhanced_large = self.enhance_plate(large_plate)
-            plate_variants.append(enhanced_large)
+        # (reduce_glare giữ nguyên kích thước nên xét trên ảnh đầu vào)
+        if not normalize and plate_image.shape[1] < 400:
+            scale = 400 / plate_image.shape[1]
+            variant('large_400', lambda img: enhance(
+                cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
+            ), 'deglared')
         
         # 10. Phiên bản với edge enhancement (giúp phân biệt 5/6 rõ hơn)
-        edges = cv2.Canny(gray_plate, 50, 150)
-        edges_dilated = cv2.dilate(edges, np.ones((2,2), np.uint8), iterations=1)
-        combined_edges = cv2.addWeighted(gray_plate, 0.7, edges_dilated, 0.3, 0)
-        enhanced_edges = self.enhance_plate(combined_edges)
-        plate_variants.append(enhanced_edges)
-        
-        # 11. Phiên bản với contrast stretching (tăng độ tương phản tối đa)
-        min_val, max_val = np.min(gray_plate), np.max(gray_plate)
-        if max_val > min_val:
-            stretched = ((gray_plate - min_val) / (max_val - min_val) * 255).astype(np.uint8)
-            enhanced_stretched = self.enhance_plate(stretched)
-            plate_variants.append(enhanced_stretched)
+        def edges(gray):
+            dilated = cv2.dilate(cv2.Canny(gray, 50, 150),
+                                 morph_kernel(cv2.MORPH_RECT, (2, 2)), iterations=1)
+            return enhance(cv2.addWeighted(gray, 0.7, dilated, 0.3, 0))
+        variant('edges', edges, 'gray')
+        
+        # 11. Phiên bản với contrast stretching (None nếu ảnh phẳng)
+        def stretched(gray):
+            min_val, max_val = np.min(gray), np.max(gray)
+            if max_val <= min_val:
+                return None
+            return enhance(
+                ((gray - min_val) / (max_val - min_val) * 255).astype(np.uint8)
+            )
+        variant('stretched', stretched, 'gray')
+        
+        # Sắp xếp phiên bản hữu ích trước (để OCR dừng sớm)
+        priority = PreprocessingConfig.OPENCV_VARIANT_PRIORITY
+        names.sort(key=lambda n: priority.index(n) if n in priority else len(priority))
+        
+        return graph, names
+    
+    def preprocess_for_ocr(self, image, return_details=False, stream=False):
+        """
+        Xử lý đầy đủ ảnh để chuẩn bị cho OCR với nhiều phương pháp
+        
+        Các phiên bản được tạo song song trên thread pool dùng chung
+        (PreprocessingConfig.VARIANT_WORKERS), thứ tự kết quả cố định.
+        
+        Args:
+            image: Ảnh đầu vào
+            return_details: Trả thêm dict thông tin xử lý (scale, ...)
+            stream: Trả VariantStream thay cho list: phiên bản chỉ được tạo
+                khi OCR cần, nên phiên bản không dùng tới (dừng sớm) không
+                tốn thời gian lẫn bộ nhớ (detect_plate / detect_plate_batch)
+            
+        Returns:
+            Tuple (danh sách ảnh biển số, tọa độ, ảnh chứa tọa độ: ảnh gốc
+            khi định vị kim tự tháp, ảnh đã resize 800px khi không)
+            (+ dict details nếu return_details=True)
+        """
+        source, candidates = self.find_plate_candidates(image)
+        if not candidates:
+            if return_details:
+                return None, None, source, {}
+            return None, None, source
+        
+        contour, likeness = candidates[0]
+        plate_variants, coordinates, details = self.prepare_candidate(
+            source, contour, stream
+        )
+        details['candidate_score'] = likeness['score']
+        if return_details:
+            return plate_variants, coordinates, source, details
+        return plate_variants, coordinates, source
+    
+    def preprocess_candidates(self, image, top_k=None, stream=True):
+        """
+        Như preprocess_for_ocr nhưng cho top-K ứng viên biển số
         
-        return plate_variants, coordinates, deskewed
+        OCR lần lượt theo thứ tự và dừng ở ứng viên đầu tiên được chấp nhận
+        (LicensePlateDetector.detect_plate_candidates); phiên bản của ứng
+        viên không dùng tới không bao giờ được tạo (stream=True).
+        
+        Args:
+            image: Ảnh đầu vào
+            top_k: Số ứng viên tối đa (mặc định CANDIDATE_TOP_K)
+            stream: Trả VariantStream thay cho list
+            
+        Returns:
+            Tuple (danh sách (phiên bản, tọa độ, details) theo điểm giống chữ
+            giảm dần, ảnh chứa tọa độ)
+        """
+        source, candidates = self.find_plate_candidates(image, top_k)
+        prepared = []
+        for contour, likeness in candidates:
+            plate_variants, coordinates, details = self.prepare_candidate(
+                source, contour, stream
+            )
+            details['candidate_score'] = likeness['score']
+            prepared.append((plate_variants, coordinates, details))
+        return prepared, source
+    
+    def prepare_candidate(self, source, plate_contour, stream=False):
+        """
+        Crop / nắn 1 ứng viên biển số và lập các phiên bản cho OCR
+        
+        Args:
+            source: Ảnh chứa contour
+            plate_contour: Contour ứng viên
+            stream: Trả VariantStream thay cho list
+            
+        Returns:
+            Tuple (phiên bản, tọa độ, details)
+        """
+        details = {}
+        deskew_plate = PreprocessingConfig.DESKEW_PLATE
+        
+        # Trích xuất biển số
+        plate_image, coordinates = self.extract_license_plate(source, plate_contour)
+        
+        # Tứ giác 4 đỉnh: nắn phối cảnh (đã thẳng, không cần sửa nghêng)
+        rectified = None
+        if PreprocessingConfig.RECTIFY_PLATES:
+            rectified, plate_type = self.rectify_license_plate(source, plate_contour)
+        if rectified is not None:
+            plate_image = rectified
+            details['plate_type'] = plate_type
+        elif deskew_plate:
+            plate_image, details['skew_angle'] = self.deskew_plate(plate_image)
+        details['rectified'] = rectified is not None
+        
+        # Chuẩn hóa tỉ lệ 1 lần theo chiều cao ký tự (thay cho các lần phóng to)
+        normalize = PreprocessingConfig.SCALE_NORMALIZATION
+        if normalize:
+            plate_image, details['scale'] = normalize_plate_scale(plate_image)
+        
+        # Phân tích crop 1 lần: quyết định bỏ qua bước tốn kém không cần thiết
+        stats = analyze_plate(plate_image)
+        stages = plan_plate_stages(stats)
+        details['plate_stats'] = stats
+        details['skipped_stages'] = skipped_stages(stages)
+        
+        # Tạo nhiều phiên bản xử lý khác nhau từ DAG (bước chung chỉ tính 1 lần)
+        graph, variant_names = self.build_variant_graph(plate_image, normalize, stages)
+        
+        # Thứ tự / loại bỏ phiên bản theo thống kê thắng-thua đã lưu
+        # (biển đã nắn: thống kê riêng, ít phiên bản bù méo hơn)
+        quality = stats['quality']
+        details['quality'] = quality
+        pipeline = 'opencv_rectified' if rectified is not None else 'opencv'
+        variant_names = get_variant_stats().order(pipeline, quality, variant_names)
+        if rectified is not None:
+            variant_names = variant_names[:PreprocessingConfig.RECTIFIED_MAX_VARIANTS]
+        
+        # Phiên bản được tạo khi OCR cần tới (không giữ lại trong graph)
+        plate_variants = VariantStream(
+            [(name, lambda name=name: graph.compute(name)) for name in variant_names],
+            resident=lambda: graph.nbytes() + self._enhance_memo.nbytes(),
+            stats_key=(pipeline, quality)
+        )
+        if stream:
+            details['variant_names'] = plate_variants.names
+        else:
+            images = list(plate_variants)
+            details['variant_names'] = plate_variants.yielded
+            details['graph'] = graph.stats()
+            # Danh sách giữ mọi phiên bản cùng lúc
+            details['memory'] = plate_variants.memory_report()
+            details['memory']['peak_bytes'] = max(
+                details['memory']['peak_bytes'],
+                sum(img.nbytes for img in images) + plate_variants.resident()
+            )
+            plate_variants = images
+        
+        return plate_variants, coordinates, details
@@ -138,6 +138,116 @@ def test_model(model_path="d:/game/runs/license_plate/weights/best.pt"):
     except Exception as e:
         print(f"❌ Lỗi test: {e}")
 
+def export_model(model_path="d:/game/runs/license_plate/weights/best.pt", formats=None):
+    """Export model sang ONNX / OpenVINO IR cho inference CPU (không cần torch)"""
+    from config import DetectionConfig
+    
+    if formats is None:
+        formats = DetectionConfig.YOLO_EXPORT_FORMATS
+    
+    try:
+        from ultralytics import YOLO
+        
+        print(f"\n=== EXPORT MODEL: {model_path} ===\n")
+        model = YOLO(model_path)
+        
+        exported = {}
+        for fmt in formats:
+            try:
+                # imgsz = size lúc train; NMS làm trong yolo_backends
+                # dynamic: cần cho adaptive imgsz (graph tĩnh chỉ chạy 1 size)
+                path = model.export(format=fmt, imgsz=DetectionConfig.YOLO_IMGSZ,
+                                    half=False, dynamic=DetectionConfig.YOLO_ADAPTIVE_IMGSZ,
+                                    simplify=True)
+                exported[fmt] = path
+                print(f"✓ {fmt}: {path}")
+            except Exception as e:
+                print(f"❌ Export {fmt} lỗi: {e}")
+        
+        return exported
+        
+    except Exception as e:
+        print(f"❌ Lỗi export: {e}")
+        return {}
+
+def _match_boxes(reference, candidate, tolerance):
+    """Ghép box cùng class; trả về (số box khớp, sai lệch góc lớn nhất)"""
+    matched = 0
+    max_diff = 0.0
+    used = set()
+    for ref in reference:
+        best, best_diff = None, None
+        for i, cand in enumerate(candidate):
+            if i in used or cand['cls'] != ref['cls']:
+                continue
+            diff = max(abs(int(ref[k]) - int(cand[k])) for k in ('x1', 'y1', 'x2', 'y2'))
+            if best_diff is None or diff < best_diff:
+                best, best_diff = i, diff
+        if best is not None and best_diff <= tolerance:
+            used.add(best)
+            matched += 1
+            max_diff = max(max_diff, best_diff)
+    return matched, max_diff
+
+def check_backend_parity(model_path="d:/game/runs/license_plate/weights/best.pt",
+                         images_dir="d:/game/archive/images/val", backends=None,
+                         max_images=100, tolerance=None):
+    """So sánh box của các backend đã export với PyTorch (.pt) trên ảnh val"""
+    import time
+    import cv2
+    from config import DetectionConfig
+    from yolo_detector import YOLOPlateDetector
+    
+    if backends is None:
+        backends = ('onnxruntime', 'openvino', 'opencv')
+    if tolerance is None:
+        tolerance = DetectionConfig.YOLO_PARITY_TOLERANCE
+    
+    print(f"\n=== PARITY CHECK: {model_path} ===\n")
+    
+    image_paths = sorted(Path(images_dir).glob("*.jpg"))[:max_images]
+    images = [img for img in (cv2.imread(str(p)) for p in image_paths) if img is not None]
+    if not images:
+        print(f"❌ Không có ảnh trong {images_dir}")
+        return {}
+    
+    def run(detector):
+        start = time.perf_counter()
+        plates = [detector.detect_plates_batch([img], batch_size=1)[0] for img in images]
+        return plates, (time.perf_counter() - start) * 1000 / len(images)
+    
+    reference = YOLOPlateDetector(model_path, device='cpu', backend='ultralytics')
+    if not reference.available or reference.backend.name != 'ultralytics':
+        print("❌ Không load được model PyTorch để so sánh")
+        return {}
+    ref_plates, ref_ms = run(reference)
+    ref_total = sum(len(p) for p in ref_plates)
+    print(f"📊 ultralytics: {ref_total} box, {ref_ms:.1f} ms/ảnh")
+    
+    report = {'ultralytics': {'boxes': ref_total, 'ms_per_image': ref_ms}}
+    for name in backends:
+        detector = YOLOPlateDetector(model_path, device='cpu', backend=name)
+        if not detector.available or detector.backend.name != name:
+            print(f"⚠️ {name}: không có model export / thiếu thư viện")
+            continue
+        plates, ms = run(detector)
+        matched, max_diff = 0, 0.0
+        for ref, cand in zip(ref_plates, plates):
+            m, d = _match_boxes(ref, cand, tolerance)
+            matched += m
+            max_diff = max(max_diff, d)
+        total = sum(len(p) for p in plates)
+        ok = matched == ref_total == total
+        report[name] = {'boxes': total, 'matched': matched, 'max_diff_px': max_diff,
+                        'ms_per_image': ms, 'speedup': ref_ms / ms if ms else None,
+                        'parity': ok}
+        status = "✓" if ok else "❌"
+        print(f"{status} {name}: {matched}/{ref_total} box khớp (±{tolerance}px, "
+              f"lệch max {max_diff:.0f}px), {total} box, {ms:.1f} ms/ảnh "
+              f"(x{ref_ms / ms:.1f})")
+    
+    return report
+
 if __name__ == "__main__":
     print("""
 ╔══════════════════════════════════════════════════════╗
@@ -157,6 +267,10 @@ if __name__ == "__main__":
         model_path = f"{save_dir}/weights/best.pt"
         if os.path.exists(model_path):
             test_model(model_path)
+            
+            # Export cho inference CPU + kiểm tra box khớp với .pt
+            if export_model(model_path):
+                check_backend_parity(model_path)
         
         print(f"""
 📂 KẾT QUẢ:
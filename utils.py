@@ -3,9 +3,13 @@ Utility functions for License Plate Recognition
 Shared functions to avoid code duplication
 """
 import re
+import hashlib
+import threading
+from functools import lru_cache
+
 import cv2
 import numpy as np
-from config import ValidationConfig
+from config import ValidationConfig, PreprocessingConfig, OCRConfig
 
 
 def validate_vietnamese_plate(text):
@@ -160,6 +164,19 @@ def calculate_image_quality(image):
     # Calculate Laplacian variance (blur detection)
     laplacian_var = cv2.Laplacian(gray, cv2.CV_64F).var()
     
+    return quality_from_blur(laplacian_var)
+
+
+def quality_from_blur(laplacian_var):
+    """
+    Quality bucket from Laplacian variance
+    
+    Args:
+        laplacian_var: Variance of the Laplacian of the grayscale image
+        
+    Returns:
+        str: 'good', 'medium', or 'poor'
+    """
     if laplacian_var > 500:
         return 'good'
     elif laplacian_var > 100:
@@ -168,6 +185,505 @@ def calculate_image_quality(image):
         return 'poor'
 
 
+# Immerkaer noise estimation kernel (difference of two Laplacians)
+_NOISE_KERNEL = np.array([[1, -2, 1],
+                          [-2, 4, -2],
+                          [1, -2, 1]], dtype=np.float32)
+
+
+def analyze_plate(image):
+    """
+    One cheap analysis pass over a plate crop
+    
+    Blur and noise are measured at full resolution (both shrink when the
+    image is downsampled); glare and contrast come from the histogram of a
+    copy downsampled to PreprocessingConfig.ANALYSIS_MAX_WIDTH.
+    
+    Args:
+        image: Plate crop (BGR or grayscale)
+        
+    Returns:
+        dict: blur_var, quality (as calculate_image_quality), glare_fraction
+            (share of pixels > 200, what reduce_glare inpaints),
+            contrast_range (p98 - p2), noise_sigma (Immerkaer estimate
+            outside edges, in gray levels)
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
+    h, w = gray.shape
+    
+    blur_var = float(cv2.Laplacian(gray, cv2.CV_64F).var())
+    
+    # Noise: Laplacian-difference residual, ignoring edges (text strokes)
+    noise_sigma = 0.0
+    if h > 4 and w > 4:
+        residual = np.abs(cv2.filter2D(gray, cv2.CV_32F, _NOISE_KERNEL))[1:-1, 1:-1]
+        flat = cv2.erode((cv2.Canny(gray, 50, 150) == 0).astype(np.uint8),
+                         morph_kernel(cv2.MORPH_RECT, (3, 3)))[1:-1, 1:-1]
+        flat_residual = residual[flat > 0]
+        if flat_residual.size:
+            noise_sigma = float(np.sqrt(np.pi / 2) * flat_residual.mean() / 6.0)
+    
+    # Histogram statistics on a small copy
+    max_width = PreprocessingConfig.ANALYSIS_MAX_WIDTH
+    small = gray
+    if w > max_width:
+        small = cv2.resize(gray, (max_width, max(1, round(h * max_width / w))),
+                           interpolation=cv2.INTER_AREA)
+    hist = cv2.calcHist([small], [0], None, [256], [0, 256]).ravel()
+    total = hist.sum()
+    cdf = np.cumsum(hist) / total
+    glare_fraction = float(hist[201:].sum() / total)
+    p2, p98 = np.searchsorted(cdf, [0.02, 0.98])
+    
+    return {
+        'blur_var': blur_var,
+        'quality': quality_from_blur(blur_var),
+        'glare_fraction': glare_fraction,
+        'contrast_range': int(p98 - p2),
+        'noise_sigma': noise_sigma,
+    }
+
+
+def plan_plate_stages(stats):
+    """
+    Decide which expensive stages to run for a plate from analyze_plate stats
+    
+    Args:
+        stats: dict from analyze_plate (None = run everything)
+        
+    Returns:
+        dict: stage name -> bool (run or skip)
+    """
+    if stats is None or not PreprocessingConfig.GATE_STAGES:
+        return {'reduce_glare': True, 'denoise': True}
+    return {
+        # Inpainting an empty / tiny mask changes (almost) nothing
+        'reduce_glare': stats['glare_fraction'] >= PreprocessingConfig.GATE_GLARE_MIN_FRACTION,
+        # fastNlMeans on a clean crop only blurs strokes
+        'denoise': stats['noise_sigma'] >= PreprocessingConfig.GATE_DENOISE_MIN_SIGMA,
+    }
+
+
+def skipped_stages(stages):
+    """Names of stages plan_plate_stages decided to skip"""
+    return [name for name, run in stages.items() if not run]
+
+
+def _profile_sharpness(binary, angle):
+    """Variance of the row ink profile of binary rotated by angle (degrees)"""
+    h, w = binary.shape
+    if angle:
+        M = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+        binary = cv2.warpAffine(binary, M, (w, h), flags=cv2.INTER_NEAREST)
+    return float(np.var(binary.sum(axis=1, dtype=np.float64)))
+
+
+def estimate_skew_angle(image, max_angle=None):
+    """
+    Skew angle of the text in a plate crop (projection-profile search)
+
+    The ink mask (Otsu, minority class) of a small copy is rotated over
+    candidate angles; text rows are horizontal when the row profile is
+    sharpest (highest variance). Coarse 1-degree search, then 0.25 degree
+    refinement around the best angle.
+
+    Args:
+        image: Plate crop (BGR or grayscale)
+        max_angle: Largest angle searched (default PreprocessingConfig.DESKEW_MAX_ANGLE)
+
+    Returns:
+        float: Angle in degrees to rotate by (cv2.getRotationMatrix2D
+            convention), 0.0 when the crop is too small or flat
+    """
+    if max_angle is None:
+        max_angle = PreprocessingConfig.DESKEW_MAX_ANGLE
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
+    h, w = gray.shape
+    if h < 8 or w < 16:
+        return 0.0
+
+    width = PreprocessingConfig.DESKEW_ANALYSIS_WIDTH
+    if w > width:
+        gray = cv2.resize(gray, (width, max(8, round(h * width / w))),
+                          interpolation=cv2.INTER_AREA)
+
+    _, binary = cv2.threshold(gray, 0, 1, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    if binary.mean() > 0.5:
+        binary = 1 - binary
+    if not binary.any():
+        return 0.0
+
+    def search(angles):
+        # Smallest |angle| first: ties keep the least rotation
+        angles = sorted(angles, key=abs)
+        scores = [_profile_sharpness(binary, angle) for angle in angles]
+        return angles[int(np.argmax(scores))]
+
+    coarse = search(range(-int(max_angle), int(max_angle) + 1))
+    fine = search([coarse + step * 0.25 for step in range(-3, 4)])
+    return float(fine)
+
+
+def _ramp(value, zero_low, one_low, one_high, zero_high):
+    """Trapezoid: 0 outside [zero_low, zero_high], 1 on [one_low, one_high]"""
+    if value <= zero_low or value >= zero_high:
+        return 0.0
+    if value < one_low:
+        return (value - zero_low) / (one_low - zero_low)
+    if value > one_high:
+        return (zero_high - value) / (zero_high - one_high)
+    return 1.0
+
+
+def text_likeness(image):
+    """
+    Cheap score of how much a candidate region looks like a plate with text
+
+    Computed on a copy PreprocessingConfig.CANDIDATE_SCORE_WIDTH wide:
+    - edge density (Canny pixels share; plates sit in a mid band)
+    - number of character-like connected components of the ink (Otsu,
+      minority class): 5 to 12 for 1- and 2-line plates
+    - regularity of their heights (characters share one height)
+    - aspect fit of the region to a BSD (~4.7:1) or BSV (~2:1) plate
+
+    Args:
+        image: Candidate crop (BGR or grayscale)
+
+    Returns:
+        dict: score in [0, 1] plus edge_density, components, regularity,
+            aspect_fit
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
+    h, w = gray.shape
+    result = {'score': 0.0, 'edge_density': 0.0, 'components': 0,
+              'regularity': 0.0, 'aspect_fit': 0.0}
+    if h < 8 or w < 16:
+        return result
+
+    aspect = w / h
+    result['aspect_fit'] = float(clamp(1.0 - min(abs(np.log(aspect / 4.7)),
+                                           abs(np.log(aspect / 2.0))) / np.log(2.0)))
+
+    width = PreprocessingConfig.CANDIDATE_SCORE_WIDTH
+    if w != width:
+        gray = cv2.resize(gray, (width, max(8, round(h * width / w))),
+                          interpolation=cv2.INTER_AREA)
+    h, w = gray.shape
+
+    result['edge_density'] = float(np.count_nonzero(cv2.Canny(gray, 50, 150))) / (h * w)
+
+    # Ink polarity is unknown (the crop margin may be darker than the
+    # plate), so both classes are tried and the more text-like one kept
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    for ink in (cv2.bitwise_not(binary), binary):
+        _, _, stats, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+        # Character-like: 20-90% of the region height, narrow, not a speck
+        comp_w = stats[1:, cv2.CC_STAT_WIDTH]
+        comp_h = stats[1:, cv2.CC_STAT_HEIGHT]
+        chars = comp_h[(comp_h >= 0.2 * h) & (comp_h <= 0.9 * h) &
+                       (comp_w <= 0.25 * w) & (comp_w >= 2)]
+        regularity = 0.0
+        if len(chars) >= 2:
+            regularity = clamp(1.0 - float(chars.std() / chars.mean()) / 0.5)
+        if (_ramp(len(chars), 1, 5, 12, 24) + regularity >
+                _ramp(result['components'], 1, 5, 12, 24) + result['regularity']):
+            result['components'] = int(len(chars))
+            result['regularity'] = regularity
+
+    result['score'] = float(
+        0.25 * _ramp(result['edge_density'], 0.02, 0.08, 0.25, 0.45) +
+        0.35 * _ramp(result['components'], 1, 5, 12, 24) +
+        0.25 * result['regularity'] +
+        0.15 * result['aspect_fit']
+    )
+    return result
+
+
+def plate_color_mask(image, kernel_size=7):
+    """
+    Mask of plate-colored pixels (white / ivory / light silver plates)
+
+    Args:
+        image: BGR image
+        kernel_size: Morphology kernel size (scale with the image width)
+
+    Returns:
+        np.ndarray: uint8 mask (255 = plate color)
+    """
+    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+
+    # Standard white
+    mask1 = cv2.inRange(hsv, np.array([0, 0, 180]), np.array([180, 30, 255]))
+    # Ivory (light yellow)
+    mask2 = cv2.inRange(hsv, np.array([15, 0, 170]), np.array([30, 40, 255]))
+    # Silver / light gray
+    mask3 = cv2.inRange(hsv, np.array([0, 0, 150]), np.array([180, 50, 200]))
+
+    mask = cv2.bitwise_or(mask1, mask2)
+    mask = cv2.bitwise_or(mask, mask3)
+
+    # Clean up: close character holes, drop specks
+    kernel = morph_kernel(cv2.MORPH_RECT, (kernel_size, kernel_size))
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, iterations=2)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, iterations=1)
+
+    return mask
+
+
+def color_plate_rois(image):
+    """
+    Regions worth searching for a plate, from the plate color mask
+
+    The mask is computed on a copy PreprocessingConfig.COLOR_ROI_WIDTH wide;
+    its connected components with a plate-like aspect ratio are expanded by
+    COLOR_ROI_MARGIN and mapped back to image coordinates.
+
+    Args:
+        image: BGR image
+
+    Returns:
+        list: (x, y, w, h) boxes, largest first; empty when nothing plate
+            colored is found or the boxes cover more than COLOR_ROI_MAX_COVERAGE
+            of the image (the caller should then search the whole image)
+    """
+    h, w = image.shape[:2]
+    width = min(w, PreprocessingConfig.COLOR_ROI_WIDTH)
+    scale = width / w
+    small = image
+    if width < w:
+        small = cv2.resize(image, (width, max(1, round(h * scale))),
+                           interpolation=cv2.INTER_LINEAR)
+    sh, sw = small.shape[:2]
+
+    # The 7px kernel of find_plate_by_color was tuned on 800px frames
+    kernel_size = max(3, round(7 * width / 800)) | 1
+    mask = plate_color_mask(small, kernel_size)
+    count, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+
+    margin = PreprocessingConfig.COLOR_ROI_MARGIN
+    min_area = PreprocessingConfig.COLOR_ROI_MIN_AREA * sh * sw
+    boxes = []
+    for x, y, bw, bh, area in stats[1:]:
+        if area < min_area or not 1.2 <= bw / bh <= 6.0:
+            continue
+        x0 = max(0, int((x - bw * margin) / scale))
+        y0 = max(0, int((y - bh * margin) / scale))
+        x1 = min(w, int((x + bw * (1 + margin)) / scale) + 1)
+        y1 = min(h, int((y + bh * (1 + margin)) / scale) + 1)
+        boxes.append((x0, y0, x1 - x0, y1 - y0))
+
+    boxes.sort(key=lambda box: box[2] * box[3], reverse=True)
+    boxes = boxes[:PreprocessingConfig.COLOR_ROI_MAX]
+    if sum(bw * bh for _, _, bw, bh in boxes) > PreprocessingConfig.COLOR_ROI_MAX_COVERAGE * h * w:
+        return []
+    return boxes
+
+
+def union_box(boxes):
+    """Bounding (x, y, w, h) of a list of (x, y, w, h) boxes"""
+    x0 = min(x for x, _, _, _ in boxes)
+    y0 = min(y for _, y, _, _ in boxes)
+    x1 = max(x + w for x, _, w, _ in boxes)
+    y1 = max(y + h for _, y, _, h in boxes)
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def tile_grid(width, height, tile_size, overlap):
+    """
+    Overlapping square tiles covering an image
+
+    Args:
+        width, height: Image size
+        tile_size: Tile side in pixels
+        overlap: Fraction of tile_size shared by neighbouring tiles
+
+    Returns:
+        list: (x, y, w, h) tiles, row by row; the last row / column is
+            aligned to the image border
+    """
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        step = max(1, int(tile_size * (1 - overlap)))
+        positions = list(range(0, length - tile_size, step))
+        return positions + [length - tile_size]
+
+    size_x, size_y = min(tile_size, width), min(tile_size, height)
+    return [(x, y, size_x, size_y) for y in starts(height) for x in starts(width)]
+
+
+def tile_activity(image, tiles, previous=None, analysis_width=320, motion_threshold=12):
+    """
+    Texture (and motion) of each tile, measured on a downscaled gray copy
+
+    Texture is the mean absolute Laplacian; motion the fraction of pixels
+    that changed by more than motion_threshold since the previous frame (a
+    small moving object barely moves a tile's mean difference). Per-tile
+    means come from integral images, so the cost does not depend on the
+    number of tiles.
+
+    Args:
+        image: BGR or grayscale frame
+        tiles: (x, y, w, h) tiles in image coordinates
+        previous: Previous frame of the same size, or None
+        analysis_width: Width of the analysis copy
+        motion_threshold: Gray level change counted as motion
+
+    Returns:
+        tuple: (texture, motion) float arrays per tile (motion None
+            without a previous frame)
+    """
+    def small_gray(frame):
+        gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if gray.shape[1] > analysis_width:
+            gray = cv2.resize(gray, (analysis_width, max(1, round(gray.shape[0] * scale))),
+                              interpolation=cv2.INTER_AREA)
+        return gray
+
+    def tile_means(values):
+        integral = cv2.integral(values, sdepth=cv2.CV_64F)
+        means = []
+        for x, y, w, h in tiles:
+            x0, y0 = int(x * scale), int(y * scale)
+            x1 = max(x0 + 1, min(values.shape[1], int(round((x + w) * scale))))
+            y1 = max(y0 + 1, min(values.shape[0], int(round((y + h) * scale))))
+            total = integral[y1, x1] - integral[y0, x1] - integral[y1, x0] + integral[y0, x0]
+            means.append(total / ((x1 - x0) * (y1 - y0)))
+        return np.array(means, dtype=np.float32)
+
+    scale = min(1.0, analysis_width / image.shape[1])
+    gray = small_gray(image)
+    texture = tile_means(np.abs(cv2.Laplacian(gray, cv2.CV_32F)))
+
+    motion = None
+    if previous is not None and previous.shape[:2] == image.shape[:2]:
+        changed = cv2.absdiff(gray, small_gray(previous)) > motion_threshold
+        motion = tile_means(changed.astype(np.float32))
+    return texture, motion
+
+
+def order_quad(points):
+    """
+    Order 4 corner points as top-left, top-right, bottom-right, bottom-left
+
+    Args:
+        points: Array-like of 4 (x, y) points (any shape reshaping to (4, 2))
+
+    Returns:
+        np.ndarray: (4, 2) float32
+    """
+    pts = np.asarray(points, dtype=np.float32).reshape(4, 2)
+    sums = pts.sum(axis=1)
+    diffs = pts[:, 1] - pts[:, 0]
+    return np.array([pts[np.argmin(sums)], pts[np.argmin(diffs)],
+                     pts[np.argmax(sums)], pts[np.argmax(diffs)]], dtype=np.float32)
+
+
+def quad_aspect_ratio(quad):
+    """Width / height of an ordered quad (mean of opposite sides)"""
+    tl, tr, br, bl = quad
+    width = (np.linalg.norm(tr - tl) + np.linalg.norm(br - bl)) / 2
+    height = (np.linalg.norm(bl - tl) + np.linalg.norm(br - tr)) / 2
+    return float(width / height) if height > 0 else 0.0
+
+
+def quad_corner_offset(quad):
+    """
+    Largest distance (px) from a quad corner to the matching corner of its
+    axis-aligned bounding box; 0 for a box (nothing to rectify)
+    """
+    quad = order_quad(quad)
+    x0, y0 = quad.min(axis=0)
+    x1, y1 = quad.max(axis=0)
+    box = np.array([[x0, y0], [x1, y0], [x1, y1], [x0, y1]], dtype=np.float32)
+    return float(np.linalg.norm(quad - box, axis=1).max())
+
+
+def plate_type_from_quad(quad):
+    """'BSD' (one-line, long) or 'BSV' (two-line, square) from the quad shape"""
+    return 'BSD' if quad_aspect_ratio(quad) >= PreprocessingConfig.RECTIFY_BSD_MIN_ASPECT else 'BSV'
+
+
+def find_plate_quad(image):
+    """
+    Refine the 4 plate corners inside a detector box crop
+
+    The plate background is the largest bright region of the crop (Otsu,
+    closed so characters do not split it); its hull is approximated by a
+    quadrilateral, or by its minimum-area rectangle when no 4-vertex
+    approximation exists.
+
+    Args:
+        image: Crop around the plate (BGR or grayscale)
+
+    Returns:
+        np.ndarray: Ordered (4, 2) float32 corners, or None if no plausible
+            plate outline covers PreprocessingConfig.RECTIFY_MIN_AREA_FRACTION
+            of the crop
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
+    h, w = gray.shape
+    if h < 16 or w < 16:
+        return None
+
+    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+    _, mask = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    size = max(3, (min(h, w) // 8) | 1)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, morph_kernel(cv2.MORPH_RECT, (size, size)))
+
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return None
+    hull = cv2.convexHull(max(contours, key=cv2.contourArea))
+    if cv2.contourArea(hull) < PreprocessingConfig.RECTIFY_MIN_AREA_FRACTION * h * w:
+        return None
+
+    perimeter = cv2.arcLength(hull, True)
+    quad = None
+    for epsilon in (0.02, 0.04, 0.06, 0.08):
+        approx = cv2.approxPolyDP(hull, epsilon * perimeter, True)
+        if len(approx) == 4:
+            quad = approx
+            break
+    if quad is None:
+        quad = cv2.boxPoints(cv2.minAreaRect(hull))
+
+    quad = order_quad(quad)
+    if not 1.2 <= quad_aspect_ratio(quad) <= 6.0:
+        return None
+    return quad
+
+
+def rectify_plate(image, quad, plate_type=None):
+    """
+    Warp a plate quadrilateral to the canonical plate size
+
+    Args:
+        image: Source image
+        quad: 4 corners (any order)
+        plate_type: 'BSD' or 'BSV' (default: from the quad aspect ratio)
+
+    Returns:
+        Tuple (rectified plate image, plate type)
+    """
+    quad = order_quad(quad)
+    if plate_type is None:
+        plate_type = plate_type_from_quad(quad)
+    width, height = PreprocessingConfig.RECTIFY_SIZES[plate_type]
+
+    # Small margin around the outline so edge characters are not clipped
+    margin = PreprocessingConfig.RECTIFY_MARGIN
+    center = quad.mean(axis=0)
+    quad = center + (quad - center) * (1.0 + 2.0 * margin)
+
+    target = np.array([[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]],
+                      dtype=np.float32)
+    M = cv2.getPerspectiveTransform(quad.astype(np.float32), target)
+    rectified = cv2.warpPerspective(image, M, (width, height), flags=cv2.INTER_CUBIC,
+                                    borderMode=cv2.BORDER_REPLICATE)
+    return rectified, plate_type
+
+
 def resize_if_needed(image, target_width):
     """
     Resize image if width is less than target
@@ -201,6 +717,384 @@ def ensure_bgr(image):
     return image
 
 
+# Per-thread CLAHE objects: cv2.CLAHE keeps internal state and is not
+# safe to share between threads
+_clahe_local = threading.local()
+
+
+def get_clahe(clip_limit, tile_grid_size):
+    """
+    Get a cached CLAHE object (created once per thread and parameter set)
+    
+    Args:
+        clip_limit: CLAHE clip limit
+        tile_grid_size: CLAHE tile grid size (w, h)
+        
+    Returns:
+        cv2.CLAHE
+    """
+    cache = getattr(_clahe_local, 'cache', None)
+    if cache is None:
+        cache = _clahe_local.cache = {}
+    key = (float(clip_limit), tuple(tile_grid_size))
+    clahe = cache.get(key)
+    if clahe is None:
+        clahe = cv2.createCLAHE(clipLimit=key[0], tileGridSize=key[1])
+        cache[key] = clahe
+    return clahe
+
+
+@lru_cache(maxsize=None)
+def gamma_lut(gamma):
+    """
+    Cached 256-entry lookup table for gamma correction (read-only)
+    
+    Args:
+        gamma: Gamma value (table maps i -> (i/255)^(1/gamma) * 255)
+        
+    Returns:
+        np.ndarray: uint8 table for cv2.LUT
+    """
+    inv_gamma = 1.0 / gamma
+    table = np.array([((i / 255.0) ** inv_gamma) * 255 for i in range(256)]).astype("uint8")
+    table.setflags(write=False)
+    return table
+
+
+@lru_cache(maxsize=None)
+def morph_kernel(shape, size):
+    """
+    Cached structuring element (read-only)
+    
+    Args:
+        shape: cv2.MORPH_RECT / MORPH_ELLIPSE / MORPH_CROSS
+        size: Kernel size (w, h)
+        
+    Returns:
+        np.ndarray
+    """
+    kernel = cv2.getStructuringElement(shape, size)
+    kernel.setflags(write=False)
+    return kernel
+
+
+@lru_cache(maxsize=None)
+def sharpen_kernel(center):
+    """
+    Cached 3x3 sharpen kernel with the given center weight (read-only)
+    
+    Args:
+        center: Center weight (neighbours are -1)
+        
+    Returns:
+        np.ndarray
+    """
+    kernel = np.array([[-1, -1, -1],
+                       [-1, center, -1],
+                       [-1, -1, -1]])
+    kernel.setflags(write=False)
+    return kernel
+
+
+def image_digest(image):
+    """
+    Content hash of an image (shape, dtype and pixels)
+    
+    Args:
+        image: Input image
+        
+    Returns:
+        bytes: Digest usable as a cache key
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr((image.shape, image.dtype.str)).encode())
+    h.update(np.ascontiguousarray(image).data)
+    return h.digest()
+
+
+def image_fingerprint(image, grid_size=None):
+    """
+    Cheap binary fingerprint of a plate variant (near-duplicate detection)
+    
+    Otsu binarization of a small copy with ink = minority class (so a
+    variant and its inverse match), cropped to the ink bounding box (variants
+    differ in borders and scale) and resampled to a fixed grid.
+    
+    Args:
+        image: Variant image (BGR or grayscale)
+        grid_size: Fingerprint size (w, h) (default from config)
+        
+    Returns:
+        np.ndarray: Boolean grid
+    """
+    if grid_size is None:
+        grid_size = PreprocessingConfig.DEDUP_GRID_SIZE
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if len(image.shape) == 3 else image
+    
+    # Work on a small copy: the fingerprint is a coarse grid anyway
+    scale = min(1.0, 4.0 * grid_size[0] / gray.shape[1])
+    if scale < 1.0:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    ink = binary == 0
+    if np.count_nonzero(ink) > ink.size / 2:
+        ink = ~ink
+    
+    ys, xs = np.nonzero(ink)
+    if ys.size == 0:
+        return np.zeros((grid_size[1], grid_size[0]), dtype=bool)
+    
+    # Ink bounding box, ignoring isolated specks
+    y0, y1 = np.percentile(ys, [1, 99]).astype(int)
+    x0, x1 = np.percentile(xs, [1, 99]).astype(int)
+    crop = ink[y0:y1 + 1, x0:x1 + 1].astype(np.uint8) * 255
+    return cv2.resize(crop, tuple(grid_size), interpolation=cv2.INTER_AREA) >= 128
+
+
+def fingerprint_distance(fp1, fp2):
+    """
+    Fraction of differing cells between two fingerprints
+    
+    Args:
+        fp1, fp2: Fingerprints from image_fingerprint
+        
+    Returns:
+        float: 0 (identical) .. 1
+    """
+    return np.count_nonzero(fp1 != fp2) / fp1.size
+
+
+def estimate_char_height(image):
+    """
+    Estimate character height of a plate crop from connected components
+    
+    Args:
+        image: Plate crop (BGR or grayscale)
+        
+    Returns:
+        float: Median character height in pixels, or None if not measurable
+    """
+    if len(image.shape) == 3:
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    else:
+        gray = image
+    
+    h = gray.shape[0]
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    if cv2.countNonZero(binary) > binary.size / 2:
+        binary = cv2.bitwise_not(binary)
+    
+    _, _, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    widths = stats[1:, cv2.CC_STAT_WIDTH]
+    heights = stats[1:, cv2.CC_STAT_HEIGHT]
+    
+    # Character-like: not a speck, not the plate border, taller than wide-ish
+    keep = (heights >= 0.15 * h) & (heights <= 0.95 * h) & (widths <= 1.5 * heights) & (heights >= 6)
+    if np.count_nonzero(keep) < 3:
+        return None
+    
+    return float(np.median(heights[keep]))
+
+
+def _ocr_canvas_pixels(width, height, mag_ratio, canvas_size):
+    """Pixels CRAFT convolves for an image (mirrors resize_aspect_ratio)"""
+    longest = max(width, height)
+    ratio = min(longest * mag_ratio, canvas_size) / longest
+    return int(width * ratio) * int(height * ratio)
+
+
+def normalize_plate_scale(image, target_char_height=None):
+    """
+    Resize a plate crop once so characters reach the recognizer's height
+    Replaces the chain of upscales (800px, 2x, 400px, MAG_RATIO=3.0)
+    
+    Args:
+        image: Plate crop
+        target_char_height: Target character height (default from config)
+        
+    Returns:
+        tuple: (resized crop, report dict with scale and pixel savings)
+    """
+    if target_char_height is None:
+        target_char_height = PreprocessingConfig.TARGET_CHAR_HEIGHT
+    
+    h, w = image.shape[:2]
+    char_height = estimate_char_height(image)
+    measured = char_height is not None
+    if not measured:
+        char_height = h * PreprocessingConfig.FALLBACK_CHAR_HEIGHT_RATIO
+    
+    scale = clamp(target_char_height / max(char_height, 1.0),
+                  PreprocessingConfig.MIN_SCALE, PreprocessingConfig.MAX_SCALE)
+    
+    if abs(scale - 1.0) < 0.05:
+        scale = 1.0
+        resized = image
+    else:
+        interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_CUBIC
+        resized = cv2.resize(image, None, fx=scale, fy=scale, interpolation=interpolation)
+    
+    new_h, new_w = resized.shape[:2]
+    
+    # Legacy path: enhance_plate upscales to 800px, then CRAFT magnifies by MAG_RATIO
+    legacy_w = max(w, PreprocessingConfig.MIN_RESIZE_WIDTH * 2)
+    legacy_h = int(h * legacy_w / w)
+    pixels_before = _ocr_canvas_pixels(legacy_w, legacy_h, OCRConfig.MAG_RATIO, OCRConfig.CANVAS_SIZE)
+    pixels_after = _ocr_canvas_pixels(new_w, new_h, OCRConfig.NORMALIZED_MAG_RATIO,
+                                      OCRConfig.NORMALIZED_CANVAS_SIZE)
+    
+    report = {
+        'char_height': char_height,
+        'char_height_measured': measured,
+        'scale': scale,
+        'input_size': (w, h),
+        'output_size': (new_w, new_h),
+        'ocr_pixels_before': pixels_before,
+        'ocr_pixels_after': pixels_after,
+        'ocr_pixels_saved': pixels_before - pixels_after
+    }
+    
+    return resized, report
+
+
+def find_text_line_split(image, search_range=(0.3, 0.7)):
+    """
+    Find the row separating the two text lines of a square (BSV) plate
+    using the horizontal projection profile of the binarized crop
+    
+    Args:
+        image: Plate crop (BGR or grayscale)
+        search_range: Fraction of height where the gap is searched
+        
+    Returns:
+        int: Split row, or None if the crop is too small
+    """
+    if len(image.shape) == 3:
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    else:
+        gray = image
+    
+    h = gray.shape[0]
+    lo, hi = int(h * search_range[0]), int(h * search_range[1])
+    if hi - lo < 2:
+        return None
+    
+    # Text pixels = minority class after Otsu
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    if cv2.countNonZero(binary) > binary.size / 2:
+        binary = cv2.bitwise_not(binary)
+    
+    # Ink per row, lightly smoothed; the gap between lines is the valley
+    profile = np.count_nonzero(binary, axis=1).astype(np.float32)
+    profile = np.convolve(profile, np.ones(3, dtype=np.float32) / 3, mode='same')
+    
+    # Middle of the emptiest rows, not the first one next to a line
+    window = profile[lo:hi]
+    valley = np.flatnonzero(window <= window.min() + 0.5)
+    return lo + int(np.median(valley))
+
+
+def estimate_text_polarity(image):
+    """
+    Cheap estimate of text polarity of a plate variant
+    
+    Binary variants: the background is the majority colour.
+    Grayscale: the Otsu majority of the centre region must agree with the
+    border (background) brightness relative to the Otsu threshold.
+    
+    Args:
+        image: Plate variant (BGR or grayscale)
+        
+    Returns:
+        str: 'dark_on_light', 'light_on_dark' or 'ambiguous'
+    """
+    if len(image.shape) == 3:
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    else:
+        gray = image
+    
+    majority = PreprocessingConfig.POLARITY_MAJORITY_RATIO
+    h, w = gray.shape[:2]
+    if h < 4 or w < 4:
+        return 'ambiguous'
+    
+    # Binary variant: foreground ratio decides
+    if np.count_nonzero((gray != 0) & (gray != 255)) == 0:
+        white_ratio = cv2.countNonZero(gray) / gray.size
+        if white_ratio >= majority:
+            return 'dark_on_light'
+        if white_ratio <= 1.0 - majority:
+            return 'light_on_dark'
+        return 'ambiguous'
+    
+    # Flat image: nothing to decide on
+    low, high = np.percentile(gray, [2, 98])
+    if high - low < PreprocessingConfig.POLARITY_MIN_RANGE:
+        return 'ambiguous'
+    
+    thresh, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    
+    # Signal 1: majority class of the centre region
+    my, mx = h // 10, w // 10
+    centre = binary[my:h - my, mx:w - mx]
+    white_ratio = cv2.countNonZero(centre) / max(centre.size, 1)
+    if white_ratio >= majority:
+        by_ratio = 'dark_on_light'
+    elif white_ratio <= 1.0 - majority:
+        by_ratio = 'light_on_dark'
+    else:
+        return 'ambiguous'
+    
+    # Signal 2: border brightness vs Otsu threshold
+    b = max(1, min(h, w) // 20)
+    border = np.concatenate([
+        gray[:b].ravel(), gray[-b:].ravel(), gray[:, :b].ravel(), gray[:, -b:].ravel()
+    ])
+    by_border = 'dark_on_light' if np.median(border) > thresh else 'light_on_dark'
+    
+    return by_ratio if by_ratio == by_border else 'ambiguous'
+
+
+def prepare_ocr_input(image, raw=True):
+    """
+    Prepare an image for EasyOCR
+    
+    Raw mode hands EasyOCR the uint8 array itself: no JPEG encode/decode
+    round trip (which costs two codec passes and blurs binarized variants),
+    and no copy for contiguous grayscale. EasyOCR passes 3-channel arrays to
+    CRAFT unchanged but decodes bytes to RGB, so BGR input is converted to
+    RGB to keep the channel order of the legacy JPEG bytes path.
+    Legacy mode keeps the old JPEG bytes path.
+    
+    Args:
+        image: numpy array or file path
+        raw: Pass arrays through instead of JPEG-encoding them
+        
+    Returns:
+        ndarray, bytes or path for Reader.readtext; None if unsupported
+    """
+    if isinstance(image, str):
+        return image
+    if not isinstance(image, np.ndarray):
+        return None
+    
+    if raw:
+        if image.dtype != np.uint8:
+            image = np.clip(image, 0, 255).astype(np.uint8)
+        if image.ndim == 3 and image.shape[2] == 3:
+            return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        # No-op (same object) for contiguous arrays
+        return np.ascontiguousarray(image)
+    
+    # Legacy: grayscale -> BGR, then JPEG bytes
+    image = ensure_bgr(image)
+    success, encoded_image = cv2.imencode('.jpg', image)
+    if not success:
+        return None
+    return encoded_image.tobytes()
+
+
 def clamp(value, min_val=0.0, max_val=1.0):
     """
     Clamp value between min and max
@@ -0,0 +1,210 @@
+"""
+Per-variant statistics and adaptive variant ordering
+- Persisted JSON store: runs, wins, OCR time per (pipeline, quality, variant)
+- UCB bandit: order variants by optimistic win rate per millisecond of OCR
+- Prune persistent losers (win rate confidently below a floor)
+"""
+import json
+import math
+import os
+import random
+import threading
+
+from config import PreprocessingConfig
+
+
+def wilson_upper(wins, runs, z=1.96):
+    """
+    Wilson score upper bound of a win rate
+
+    Args:
+        wins: Number of wins
+        runs: Number of runs
+        z: Normal quantile (1.96 = 95%)
+
+    Returns:
+        float: Upper bound in [0, 1]
+    """
+    if runs == 0:
+        return 1.0
+    rate = wins / runs
+    denom = 1.0 + z * z / runs
+    center = rate + z * z / (2 * runs)
+    margin = z * math.sqrt(rate * (1 - rate) / runs + z * z / (4 * runs * runs))
+    return min(1.0, (center + margin) / denom)
+
+
+class VariantStatsStore:
+    """Win / OCR-time statistics of preprocessing variants"""
+
+    def __init__(self, path=None, save_every=None):
+        """
+        Args:
+            path: JSON file (default PreprocessingConfig.VARIANT_STATS_PATH;
+                '' or a None config value keeps statistics in memory only)
+            save_every: Write to disk every N recorded plates
+        """
+        if path is None:
+            path = PreprocessingConfig.VARIANT_STATS_PATH
+        if save_every is None:
+            save_every = PreprocessingConfig.VARIANT_STATS_SAVE_EVERY
+        self.path = path
+        self.save_every = max(1, save_every)
+        self._lock = threading.Lock()
+        self._unsaved = 0
+        self.stats = self._load()
+
+    def _load(self):
+        """Read statistics from disk (empty if missing or unreadable)"""
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        """Write statistics to disk (atomic replace)"""
+        if not self.path:
+            return
+        with self._lock:
+            data = json.dumps(self.stats, indent=1, sort_keys=True)
+            self._unsaved = 0
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+
+    def _bucket(self, pipeline, quality):
+        return self.stats.setdefault(pipeline, {}).setdefault(
+            quality, {'plates': 0, 'variants': {}}
+        )
+
+    def record_plate(self, pipeline, quality, outcomes):
+        """
+        Record the variants OCR'd for one plate
+
+        Args:
+            pipeline: 'opencv' or 'yolo'
+            quality: Quality bucket from calculate_image_quality
+            outcomes: List of (variant name, won, ocr_ms); won = one of the
+                variant's reads voted for the final plate
+        """
+        if not outcomes:
+            return
+        with self._lock:
+            bucket = self._bucket(pipeline, quality)
+            bucket['plates'] += 1
+            for name, won, ocr_ms in outcomes:
+                entry = bucket['variants'].setdefault(name, {'runs': 0, 'wins': 0, 'ocr_ms': 0.0})
+                entry['runs'] += 1
+                entry['wins'] += int(bool(won))
+                entry['ocr_ms'] += float(ocr_ms)
+            self._unsaved += 1
+            should_save = self._unsaved >= self.save_every
+        if should_save:
+            try:
+                self.save()
+            except OSError:
+                pass
+
+    def get(self, pipeline, quality, name):
+        """Entry {'runs', 'wins', 'ocr_ms'} of a variant, or None"""
+        bucket = self.stats.get(pipeline, {}).get(quality)
+        return bucket['variants'].get(name) if bucket else None
+
+    def order(self, pipeline, quality, names):
+        """
+        Order (and prune) variants by expected benefit per millisecond
+
+        Score = UCB1 upper bound of the win rate / mean OCR time; variants
+        never run yet come first (infinite upper bound). Variants whose
+        Wilson upper bound of the win rate is below VARIANT_PRUNE_WIN_RATE
+        after VARIANT_PRUNE_MIN_RUNS runs are dropped. Until a bucket has
+        VARIANT_STATS_MIN_PLATES plates the hand-tuned order is kept, and
+        with probability VARIANT_EXPLORE_RATE it is used anyway so pruned
+        variants keep being re-evaluated.
+
+        Args:
+            pipeline: 'opencv' or 'yolo'
+            quality: Quality bucket from calculate_image_quality
+            names: Variant names in hand-tuned order
+
+        Returns:
+            list: Variant names to run, best first
+        """
+        if not PreprocessingConfig.ADAPTIVE_VARIANT_ORDER:
+            return list(names)
+
+        with self._lock:
+            bucket = self.stats.get(pipeline, {}).get(quality)
+            plates = bucket['plates'] if bucket else 0
+            entries = {name: dict(bucket['variants'].get(name) or {}) for name in names} if bucket else {}
+        if plates < PreprocessingConfig.VARIANT_STATS_MIN_PLATES:
+            return list(names)
+        if random.random() < PreprocessingConfig.VARIANT_EXPLORE_RATE:
+            return list(names)
+
+        log_plates = math.log(plates)
+        unseen = []
+        scored = []
+        for name in names:
+            entry = entries.get(name)
+            if not entry or entry['runs'] == 0:
+                unseen.append(name)
+                continue
+            runs = entry['runs']
+            # Persistent loser: win rate confidently below the floor
+            if (runs >= PreprocessingConfig.VARIANT_PRUNE_MIN_RUNS and
+                    wilson_upper(entry['wins'], runs) < PreprocessingConfig.VARIANT_PRUNE_WIN_RATE):
+                continue
+            win_ucb = min(1.0, entry['wins'] / runs + math.sqrt(2.0 * log_plates / runs))
+            mean_ms = max(entry['ocr_ms'] / runs, 1.0)
+            scored.append((win_ucb / mean_ms, name))
+
+        # Stable sort: equal scores keep the hand-tuned order
+        scored.sort(key=lambda item: item[0], reverse=True)
+        ordered = unseen + [name for _, name in scored]
+
+        # Never prune below the minimum variant count
+        missing = min(PreprocessingConfig.VARIANT_MIN_KEEP, len(names)) - len(ordered)
+        if missing > 0:
+            ordered += [name for name in names if name not in ordered][:missing]
+        return ordered
+
+    def clear(self):
+        """Forget all statistics (the file is rewritten on next save)"""
+        with self._lock:
+            self.stats = {}
+
+
+# Process-wide store (loaded on first use)
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_variant_stats():
+    """Return the process-wide VariantStatsStore"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = VariantStatsStore()
+    return _store
+
+
+def record_outcomes(stats_key, outcomes, final_text):
+    """
+    Record one plate's variant outcomes in the process-wide store
+
+    Args:
+        stats_key: (pipeline, quality) of the variant stream, or None
+        outcomes: List of (variant name, voted texts, ocr_ms)
+        final_text: Plate text finally returned
+    """
+    if stats_key is None or not outcomes or not PreprocessingConfig.ADAPTIVE_VARIANT_ORDER:
+        return
+    pipeline, quality = stats_key
+    get_variant_stats().record_plate(pipeline, quality, [
+        (name, final_text in texts, ocr_ms) for name, texts, ocr_ms in outcomes
+    ])
@@ -0,0 +1,209 @@
+"""
+Incremental vote aggregation for multi-variant OCR
+- O(1) update per OCR result (per-candidate sufficient statistics)
+- Sequential stopping rule: stop once the leader's margin cannot be
+  overturned by the remaining reads, at a configurable error rate
+- Shared by LicensePlateDetector.vote_best_result and the YOLO path
+"""
+import math
+from bisect import insort
+
+from config import ConfidenceConfig
+
+
+class CandidateStats:
+    """Sufficient statistics of the confidences voting for one text"""
+
+    __slots__ = ('text', 'first_seen', 'votes', 'conf_sum', 'conf_sq_sum',
+                 'max_conf', 'sorted_votes')
+
+    def __init__(self, text, first_seen):
+        self.text = text
+        self.first_seen = first_seen
+        self.votes = 0
+        self.conf_sum = 0.0
+        self.conf_sq_sum = 0.0
+        self.max_conf = 0.0
+        self.sorted_votes = []
+
+    def add(self, confidence, weight=1.0):
+        """Add one vote (weight < 1 for a reused duplicate vote)"""
+        self.max_conf = max(self.max_conf, confidence) if self.sorted_votes else confidence
+        self.votes += weight
+        self.conf_sum += weight * confidence
+        self.conf_sq_sum += weight * confidence * confidence
+        # (confidence, weight) kept sorted for the median; a plate gets a few
+        # dozen votes at most
+        insort(self.sorted_votes, (confidence, weight))
+
+    @property
+    def mean(self):
+        """Vote-weighted mean confidence"""
+        return self.conf_sum / self.votes
+
+    @property
+    def median(self):
+        """Vote-weighted median confidence (upper median on a tie)"""
+        half = self.votes / 2.0
+        cumulative = 0.0
+        for confidence, weight in self.sorted_votes:
+            cumulative += weight
+            if cumulative > half:
+                return confidence
+        return self.sorted_votes[-1][0]
+
+    @property
+    def std(self):
+        """Weighted population standard deviation (0 for a single vote)"""
+        if len(self.sorted_votes) < 2:
+            return 0.0
+        variance = self.conf_sq_sum / self.votes - self.mean ** 2
+        return math.sqrt(max(variance, 0.0))
+
+
+def binomial_tail(n, p, k):
+    """
+    P(X >= k) for X ~ Binomial(n, p)
+
+    Args:
+        n: Number of trials
+        p: Success probability
+        k: Threshold (rounded up: weighted vote margins may be fractional)
+
+    Returns:
+        float
+    """
+    k = math.ceil(k)
+    if k <= 0:
+        return 1.0
+    if k > n:
+        return 0.0
+    return sum(math.comb(n, i) * p ** i * (1.0 - p) ** (n - i) for i in range(k, n + 1))
+
+
+class VoteAggregator:
+    """Streaming vote counter over OCR results (text, confidence, valid)"""
+
+    def __init__(self):
+        self.candidates = {}
+        self.total = 0
+        self.valid_total = 0
+        self._leader = None
+        self._runner_up_votes = 0
+        self._best_any = None
+
+    @classmethod
+    def from_results(cls, results):
+        """
+        Build from a list of (text, confidence, valid[, ...]) tuples
+
+        Args:
+            results: OCR results
+
+        Returns:
+            VoteAggregator
+        """
+        aggregator = cls()
+        for result in results:
+            aggregator.add(result[0], result[1], result[2])
+        return aggregator
+
+    def add(self, text, confidence, valid, weight=1.0):
+        """
+        Add one OCR result in O(1)
+
+        Args:
+            text: Formatted plate text
+            confidence: OCR confidence
+            valid: Whether text is a valid Vietnamese plate
+            weight: Vote weight (< 1 for a result reused from a near-duplicate
+                variant instead of a fresh OCR read)
+        """
+        self.total += weight
+
+        # Best result overall (fallback when nothing is valid)
+        if self._best_any is None or confidence > self._best_any[1]:
+            self._best_any = (text, confidence)
+
+        if not valid:
+            return
+
+        self.valid_total += weight
+        stats = self.candidates.get(text)
+        if stats is None:
+            stats = CandidateStats(text, len(self.candidates))
+            self.candidates[text] = stats
+        stats.add(confidence, weight)
+
+        # Top-2 maintenance: only this candidate's count changed.
+        # Ties go to the earlier candidate, like Counter.most_common.
+        leader = self._leader
+        if leader is None or stats is leader:
+            self._leader = stats
+        elif (stats.votes, -stats.first_seen) > (leader.votes, -leader.first_seen):
+            self._runner_up_votes = leader.votes
+            self._leader = stats
+        elif stats.votes > self._runner_up_votes:
+            self._runner_up_votes = stats.votes
+
+    def leader(self):
+        """
+        Leading valid plate
+
+        Returns:
+            tuple: (text, votes, runner_up_votes); text is None without valid votes
+        """
+        if self._leader is None:
+            return None, 0, 0
+        return self._leader.text, self._leader.votes, self._runner_up_votes
+
+    def leader_stats(self):
+        """CandidateStats of the leader, or None"""
+        return self._leader
+
+    def best_any(self):
+        """(text, confidence) with highest confidence over all results, or None"""
+        return self._best_any
+
+    def overturn_probability(self, remaining):
+        """
+        Upper estimate of the chance that the leader is overtaken
+
+        Each remaining read is assumed to vote for a challenger with the
+        Laplace-smoothed share of non-leader valid votes seen so far; the
+        leader is overturned if challengers gain at least its margin
+        (ignoring the leader's own future votes, so this is conservative).
+
+        Args:
+            remaining: Upper bound on votes still to come
+
+        Returns:
+            float: Probability in [0, 1]
+        """
+        text, votes, runner_up = self.leader()
+        if text is None:
+            return 1.0
+        margin = votes - runner_up
+        p_challenger = (self.valid_total - votes + 1) / (self.valid_total + 2)
+        return binomial_tail(remaining, p_challenger, margin)
+
+    def is_decided(self, remaining, error_rate=None):
+        """
+        Sequential test: can the leader still be overturned?
+
+        Args:
+            remaining: Upper bound on votes still to come
+            error_rate: Accepted overturn probability (default from config);
+                0 means stop only when overtaking is impossible
+
+        Returns:
+            bool
+        """
+        if error_rate is None:
+            error_rate = ConfidenceConfig.EARLY_STOP_ERROR_RATE
+        text, votes, runner_up = self.leader()
+        if text is None:
+            return False
+        if votes > runner_up + remaining:
+            return True
+        return self.overturn_probability(remaining) <= error_rate
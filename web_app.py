@@ -4,7 +4,6 @@ Flask-based web interface
 """
 from flask import Flask, render_template, request, jsonify, send_file
 import cv2
-import numpy as np
 import os
 from werkzeug.utils import secure_filename
 import base64
@@ -12,16 +11,16 @@ from io import BytesIO
 from PIL import Image
 
 # Import existing modules
-from license_plate_detector import LicensePlateDetector
-from yolo_detector import integrate_yolo_detection
+from model_registry import get_ocr_detector, get_yolo_detector, warm_up
+from yolo_detector import integrate_yolo_detection, detect_all_plates
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max
 app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'dcm'}
 
-# Initialize detector
-ocr_detector = LicensePlateDetector()
+# Initialize detector (shared, loaded once per process)
+ocr_detector = get_ocr_detector()
 
 # Create upload folder
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -79,8 +78,9 @@ def detect_plate():
         file.save(filepath)
         
         # Try YOLO detection first
-        plate_text, confidence, method = integrate_yolo_detection(
-            filepath, ocr_detector
+        plate_text, confidence, method, details = integrate_yolo_detection(
+            filepath, ocr_detector, yolo_detector=get_yolo_detector(),
+            return_details=True
         )
         
         # If YOLO fails, try OpenCV method with MULTIPLE attempts
@@ -90,42 +90,20 @@ def detect_plate():
             
             image = cv2.imread(filepath)
             
-            # Try multiple preprocessing approaches
-            attempts = []
-            
-            # Attempt 1: Standard preprocessing
+            # Top-K candidate regions ranked by text-likeness, OCR'd in order
+            # with early exit (no whole-pipeline retries on contrast / gamma
+            # modified copies of the image)
             preprocessor = ImagePreprocessor()
-            plate_images, coords, processed = preprocessor.preprocess_for_ocr(image)
-            
-            if plate_images:
-                plate_text_1, confidence_1, ocr_results = ocr_detector.detect_plate(plate_images)
-                if validate_vietnamese_plate(plate_text_1):
-                    attempts.append((plate_text_1, confidence_1, "OpenCV"))
-            
-            # Attempt 2: Enhanced contrast
-            enhanced = cv2.convertScaleAbs(image, alpha=1.5, beta=30)
-            plate_images_2, coords_2, processed_2 = preprocessor.preprocess_for_ocr(enhanced)
-            
-            if plate_images_2:
-                plate_text_2, confidence_2, ocr_results_2 = ocr_detector.detect_plate(plate_images_2)
-                if validate_vietnamese_plate(plate_text_2):
-                    attempts.append((plate_text_2, confidence_2, "OpenCV_Enhanced"))
+            candidates, _ = preprocessor.preprocess_candidates(image)
             
-            # Attempt 3: Gamma correction
-            gamma = 1.2
-            gamma_corrected = np.power(image / 255.0, gamma) * 255.0
-            gamma_corrected = gamma_corrected.astype(np.uint8)
-            plate_images_3, coords_3, processed_3 = preprocessor.preprocess_for_ocr(gamma_corrected)
-            
-            if plate_images_3:
-                plate_text_3, confidence_3, ocr_results_3 = ocr_detector.detect_plate(plate_images_3)
-                if validate_vietnamese_plate(plate_text_3):
-                    attempts.append((plate_text_3, confidence_3, "OpenCV_Gamma"))
-            
-            # Choose best attempt
-            if attempts:
-                attempts.sort(key=lambda x: x[1], reverse=True)
-                plate_text, confidence, method = attempts[0]
+            if candidates:
+                cv_text, cv_confidence, _, _, cv_details = ocr_detector.detect_plate_candidates(
+                    candidates, return_details=True
+                )
+                if validate_vietnamese_plate(cv_text):
+                    plate_text, confidence = cv_text, cv_confidence
+                    method = "OpenCV" if cv_details['candidate'] == 0 else f"OpenCV_candidate{cv_details['candidate'] + 1}"
+                    details = cv_details
         
         # Read image for display
         image = cv2.imread(filepath)
@@ -135,13 +113,24 @@ def detect_plate():
         os.remove(filepath)
         
         if plate_text and plate_text != "Không phát hiện được biển số" and confidence > 0.25:  # Giảm từ 0.3
-            return jsonify({
+            response = {
                 'success': True,
                 'plate_number': plate_text,
                 'confidence': float(confidence),
                 'method': method,
                 'image': img_base64
-            })
+            }
+            if 'scale' in details:
+                response['ocr_pixels_saved'] = details['scale']['ocr_pixels_saved']
+            if 'dedup' in details:
+                response['ocr_calls_saved'] = details['dedup']['ocr_calls_saved']
+            if 'candidates_tried' in details:
+                response['candidates_tried'] = details['candidates_tried']
+            if 'memory' in details:
+                response['variants_computed'] = details['memory']['computed']
+                response['variants_wasted'] = details['memory']['wasted']
+                response['peak_variant_memory_kb'] = round(details['memory']['peak_bytes'] / 1024, 1)
+            return jsonify(response)
         else:
             return jsonify({
                 'success': False,
@@ -153,6 +142,47 @@ def detect_plate():
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/detect-plates', methods=['POST'])
+def detect_plates():
+    """API endpoint: every plate in the image (YOLO only, one pass)"""
+    if 'file' not in request.files:
+        return jsonify({'error': 'No file uploaded'}), 400
+    
+    file = request.files['file']
+    
+    if file.filename == '':
+        return jsonify({'error': 'No file selected'}), 400
+    
+    if not allowed_file(file.filename):
+        return jsonify({'error': 'Invalid file type'}), 400
+    
+    try:
+        filename = secure_filename(file.filename)
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        file.save(filepath)
+        
+        image = cv2.imread(filepath)
+        os.remove(filepath)
+        if image is None:
+            return jsonify({'error': 'Cannot read image'}), 400
+        
+        plates = detect_all_plates(image, ocr_detector, yolo_detector=get_yolo_detector())
+        return jsonify({
+            'success': any(plate['text'] for plate in plates),
+            'plates': [{
+                'box': [int(v) for v in plate['box']],
+                'class': plate['class'],
+                'detection_confidence': float(plate['detection_conf']),
+                'plate_number': plate['text'],
+                'confidence': float(plate['confidence']),
+                'method': plate['method']
+            } for plate in plates]
+        })
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @app.route('/api/process-dicom', methods=['POST'])
 def process_dicom():
     """API endpoint for DICOM image processing"""
@@ -210,6 +240,8 @@ if __name__ == '__main__':
     print("=" * 70)
     print("WEB APPLICATION - License Plate Recognition & DICOM Processing")
     print("=" * 70)
+    print("Loading models...")
+    warm_up()
     print("Starting Flask server...")
     print("Access at: http://localhost:5000")
     print("=" * 70)
@@ -0,0 +1,366 @@
+"""
+YOLO inference backends - same plate boxes from PyTorch or exported models
+- ultralytics: best.pt through ultralytics.YOLO (PyTorch eager)
+- onnxruntime / opencv: best.onnx (exported by train_yolo.export_model)
+- openvino: OpenVINO IR (best_openvino_model/)
+- Exported backends do their own letterbox, box decoding and NMS, so neither
+  ultralytics nor torch is imported
+"""
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from config import DetectionConfig
+
+
+BACKENDS = ('ultralytics', 'onnxruntime', 'openvino', 'opencv')
+
+# Ultralytics predict() defaults, kept so exported models give the same boxes
+NMS_IOU = 0.7
+MAX_DETECTIONS = 300
+LETTERBOX_COLOR = (114, 114, 114)
+
+
+def empty_detections():
+    """(xyxy, conf, cls) with no boxes"""
+    return (np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.float32),
+            np.zeros(0, dtype=np.float32))
+
+
+def letterbox(image, size):
+    """
+    Resize keeping the aspect ratio and pad to a size x size square
+
+    Args:
+        image: BGR image
+        size: Network input size
+
+    Returns:
+        tuple: (padded image, scale, (pad_x, pad_y))
+    """
+    h, w = image.shape[:2]
+    scale = min(size / h, size / w)
+    new_w, new_h = int(round(w * scale)), int(round(h * scale))
+    if (new_w, new_h) != (w, h):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+
+    pad_x, pad_y = (size - new_w) / 2, (size - new_h) / 2
+    top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+    left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+    padded = cv2.copyMakeBorder(image, top, bottom, left, right,
+                                cv2.BORDER_CONSTANT, value=LETTERBOX_COLOR)
+    return padded, scale, (left, top)
+
+
+def make_blob(images, size):
+    """
+    Letterboxed NCHW float32 RGB batch
+
+    Args:
+        images: List of BGR images
+        size: Network input size
+
+    Returns:
+        tuple: (blob, [(scale, pad, original shape)] per image)
+    """
+    boxed = []
+    transforms = []
+    for image in images:
+        if image.ndim == 2:
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        padded, scale, pad = letterbox(image, size)
+        boxed.append(padded)
+        transforms.append((scale, pad, image.shape[:2]))
+    blob = cv2.dnn.blobFromImages(boxed, scalefactor=1.0 / 255, swapRB=True)
+    return blob, transforms
+
+
+def decode_output(output, transform, conf_threshold, iou=NMS_IOU, max_det=MAX_DETECTIONS):
+    """
+    Boxes of one image from a raw YOLOv8 head output
+
+    Args:
+        output: (4 + num_classes, num_anchors) array, boxes as cx, cy, w, h
+            in network input pixels
+        transform: (scale, (pad_x, pad_y), (height, width)) from make_blob
+        conf_threshold: Minimum class score
+        iou: Per-class NMS IoU threshold
+        max_det: Maximum boxes kept
+
+    Returns:
+        tuple: (xyxy (N, 4), conf (N,), cls (N,)) in original image pixels
+    """
+    predictions = output.T
+    scores = predictions[:, 4:]
+    cls = scores.argmax(axis=1)
+    conf = scores[np.arange(len(scores)), cls]
+    keep = conf > conf_threshold
+    if not keep.any():
+        return empty_detections()
+    boxes, conf, cls = predictions[keep, :4], conf[keep], cls[keep]
+
+    scale, (pad_x, pad_y), (height, width) = transform
+    xyxy = np.empty_like(boxes)
+    xyxy[:, 0] = boxes[:, 0] - boxes[:, 2] / 2
+    xyxy[:, 1] = boxes[:, 1] - boxes[:, 3] / 2
+    xyxy[:, 2] = boxes[:, 0] + boxes[:, 2] / 2
+    xyxy[:, 3] = boxes[:, 1] + boxes[:, 3] / 2
+    xyxy[:, [0, 2]] = ((xyxy[:, [0, 2]] - pad_x) / scale).clip(0, width)
+    xyxy[:, [1, 3]] = ((xyxy[:, [1, 3]] - pad_y) / scale).clip(0, height)
+
+    # NMSBoxesBatched wants x, y, w, h and suppresses within each class only
+    xywh = np.column_stack([xyxy[:, :2], xyxy[:, 2:] - xyxy[:, :2]])
+    indices = cv2.dnn.NMSBoxesBatched(xywh.tolist(), conf.tolist(), cls.tolist(),
+                                      conf_threshold, iou)
+    indices = np.asarray(indices, dtype=np.int64).reshape(-1)[:max_det]
+    return (xyxy[indices].astype(np.float32), conf[indices].astype(np.float32),
+            cls[indices].astype(np.float32))
+
+
+class UltralyticsBackend:
+    """best.pt (or any ultralytics-loadable model) through ultralytics.YOLO"""
+
+    name = 'ultralytics'
+
+    def __init__(self, model_path, device='cpu', imgsz=None):
+        from ultralytics import YOLO
+        self.model = YOLO(str(model_path))
+        self.device = device
+        self.imgsz = imgsz or DetectionConfig.YOLO_IMGSZ
+
+    def supports_imgsz(self, imgsz):
+        """Any input size can be used (the network is fully convolutional)"""
+        return True
+
+    def predict(self, images, conf_threshold, imgsz=None):
+        """
+        Detect boxes in a batch of images
+
+        Args:
+            images: List of BGR images
+            conf_threshold: Minimum confidence
+            imgsz: Input size (default self.imgsz)
+
+        Returns:
+            list: (xyxy, conf, cls) numpy arrays per image
+        """
+        results = self.model(list(images), conf=conf_threshold, device=self.device,
+                             imgsz=imgsz or self.imgsz, verbose=False)
+        detections = []
+        for result in results:
+            boxes = result.boxes
+            detections.append((boxes.xyxy.cpu().numpy(), boxes.conf.cpu().numpy(),
+                               boxes.cls.cpu().numpy()))
+        return detections
+
+
+class ExportedBackend:
+    """Shared pre/post-processing of exported (raw head output) models"""
+
+    name = None
+
+    def __init__(self, imgsz=None, batch=None, fixed_size=False):
+        """
+        Args:
+            imgsz: Network input size (fixed by the exported graph if static)
+            batch: Fixed batch size of the graph, or None if dynamic
+            fixed_size: The graph only accepts imgsz x imgsz inputs
+        """
+        self.imgsz = imgsz or DetectionConfig.YOLO_IMGSZ
+        self.batch = batch
+        self.fixed_size = fixed_size
+
+    def supports_imgsz(self, imgsz):
+        """Static graphs run at their export size only"""
+        return not self.fixed_size or imgsz == self.imgsz
+
+    def _forward(self, blob):
+        """Raw output (batch, 4 + num_classes, num_anchors) for an NCHW blob"""
+        raise NotImplementedError
+
+    def predict(self, images, conf_threshold, imgsz=None):
+        """
+        Detect boxes in a batch of images
+
+        Args:
+            images: List of BGR images
+            conf_threshold: Minimum confidence
+            imgsz: Input size (default self.imgsz; ignored by static graphs)
+
+        Returns:
+            list: (xyxy, conf, cls) numpy arrays per image
+        """
+        if not images:
+            return []
+        if imgsz is None or not self.supports_imgsz(imgsz):
+            imgsz = self.imgsz
+        blob, transforms = make_blob(images, imgsz)
+        # Static-batch graphs (the default export) take one chunk at a time
+        step = self.batch or len(images)
+        outputs = [self._forward(blob[start:start + step])
+                   for start in range(0, len(images), step)]
+        output = np.concatenate(outputs, axis=0)
+        return [decode_output(output[i], transform, conf_threshold)
+                for i, transform in enumerate(transforms)]
+
+
+def _static_dim(value):
+    """Dimension of a model input shape, or None if dynamic"""
+    return value if isinstance(value, int) and value > 0 else None
+
+
+class OnnxRuntimeBackend(ExportedBackend):
+    """best.onnx through ONNX Runtime (CPU execution provider)"""
+
+    name = 'onnxruntime'
+
+    def __init__(self, model_path, imgsz=None):
+        import onnxruntime as ort
+        self.session = ort.InferenceSession(str(model_path),
+                                            providers=['CPUExecutionProvider'])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        shape = model_input.shape
+        size = _static_dim(shape[2])
+        super().__init__(size or imgsz, _static_dim(shape[0]), fixed_size=size is not None)
+
+    def _forward(self, blob):
+        return self.session.run(None, {self.input_name: blob})[0]
+
+
+class OpenVINOBackend(ExportedBackend):
+    """OpenVINO IR (directory from export(format='openvino') or the .xml)"""
+
+    name = 'openvino'
+
+    def __init__(self, model_path, imgsz=None):
+        import openvino as ov
+        model_path = Path(model_path)
+        if model_path.is_dir():
+            model_path = next(model_path.glob('*.xml'))
+        core = ov.Core()
+        self.model = core.compile_model(core.read_model(str(model_path)), 'CPU')
+        shape = self.model.input(0).get_partial_shape()
+        dims = [dim.get_length() if dim.is_static else None for dim in shape]
+        size = _static_dim(dims[2])
+        super().__init__(size or imgsz, _static_dim(dims[0]), fixed_size=size is not None)
+
+    def _forward(self, blob):
+        return self.model([blob])[self.model.output(0)]
+
+
+class OpenCVDNNBackend(ExportedBackend):
+    """best.onnx through cv2.dnn (no extra dependency)"""
+
+    name = 'opencv'
+
+    def __init__(self, model_path, imgsz=None):
+        self.net = cv2.dnn.readNetFromONNX(str(model_path))
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        # The input shape is not queryable here: assume a static export
+        super().__init__(imgsz, 1, fixed_size=True)
+
+    def _forward(self, blob):
+        self.net.setInput(blob)
+        return self.net.forward()
+
+
+def exported_model_paths(model_path):
+    """
+    Exported artifacts next to a .pt model (as written by train_yolo.export_model)
+
+    Args:
+        model_path: Path to best.pt
+
+    Returns:
+        dict: backend name -> path, for the artifacts that exist
+    """
+    model_path = Path(model_path)
+    candidates = {
+        'openvino': model_path.with_name(f"{model_path.stem}_openvino_model"),
+        'onnxruntime': model_path.with_suffix('.onnx'),
+        'opencv': model_path.with_suffix('.onnx'),
+    }
+    return {name: path for name, path in candidates.items() if path.exists()}
+
+
+def _backend_for_path(model_path):
+    """Backend that can load a model file directly"""
+    model_path = Path(model_path)
+    if model_path.suffix == '.onnx':
+        return 'onnxruntime'
+    if model_path.suffix == '.xml' or model_path.name.endswith('_openvino_model'):
+        return 'openvino'
+    return 'ultralytics'
+
+
+def _create(name, model_path, device, imgsz):
+    if name == 'ultralytics':
+        return UltralyticsBackend(model_path, device=device, imgsz=imgsz)
+    if name == 'onnxruntime':
+        return OnnxRuntimeBackend(model_path, imgsz=imgsz)
+    if name == 'openvino':
+        return OpenVINOBackend(model_path, imgsz=imgsz)
+    if name == 'opencv':
+        return OpenCVDNNBackend(model_path, imgsz=imgsz)
+    raise ValueError(f"Unknown YOLO backend: {name} (expected one of {BACKENDS})")
+
+
+def load_backend(model_path, backend=None, device='cpu', imgsz=None):
+    """
+    Load the fastest available backend for a plate model
+
+    'auto' tries, in order, OpenVINO IR, ONNX Runtime and OpenCV DNN on the
+    exported artifacts next to best.pt (or the backends matching an exported
+    model path). A named backend tries only that one. PyTorch (ultralytics)
+    is the fallback in both cases.
+
+    Args:
+        model_path: .pt, .onnx, .xml or *_openvino_model path
+        backend: 'auto' or one of BACKENDS (default DetectionConfig.YOLO_BACKEND)
+        device: Device for the ultralytics backend
+        imgsz: Default input size (graphs with a static shape keep theirs)
+
+    Returns:
+        tuple: (backend, [(name, error)] for backends that failed to load)
+
+    Raises:
+        RuntimeError: No backend could load the model
+    """
+    if backend is None:
+        backend = DetectionConfig.YOLO_BACKEND
+    if backend != 'auto' and backend not in BACKENDS:
+        raise ValueError(f"Unknown YOLO backend: {backend} (expected one of {BACKENDS})")
+
+    model_path = Path(model_path)
+    direct = _backend_for_path(model_path)
+    if direct == 'ultralytics':
+        exported = exported_model_paths(model_path)
+    else:
+        exported = {direct: model_path}
+        if direct == 'onnxruntime':
+            exported['opencv'] = model_path
+
+    errors = []
+    if backend == 'auto':
+        attempts = list(exported.items())
+    elif backend in exported:
+        attempts = [(backend, exported[backend])]
+    else:
+        attempts = []
+        if backend != 'ultralytics':
+            errors.append((backend, f"no exported model next to {model_path}"))
+    # PyTorch is always the last resort (ultralytics also loads .onnx / IR)
+    attempts.append(('ultralytics', model_path))
+
+    for name, path in attempts:
+        # GPU devices only exist for PyTorch; exported backends are CPU-only
+        if name != 'ultralytics' and str(device) not in ('cpu', ''):
+            continue
+        try:
+            return _create(name, path, device, imgsz), errors
+        except Exception as e:
+            errors.append((name, str(e)))
+    raise RuntimeError('; '.join(f"{name}: {error}" for name, error in errors))